@@ -0,0 +1,204 @@
+'''benchmarks of the IntCode machine
+
+python bench_intcode.py [--engine table] [--save results.json] [--compare old.json]
+
+Every workload reports its best time over --repeat runs, after a warm up
+run, and the instructions per second. Results saved as JSON can be compared
+with a later run, for instance across commits.
+'''
+import argparse
+import json
+import platform
+import subprocess
+import threading
+import time
+
+import intcode
+from intcode import IntCode, Profiler, Scheduler, load_program
+
+LOOP_COUNT = 200000
+PROBES = 200
+HANDOFFS = 1000
+STARTUPS = 100
+
+
+def run_program(program, inputs, **options):
+    vm = IntCode(program, **options)
+    vm.reset()
+    return vm.run_until(inputs=inputs)
+
+
+def program_workload(filename, inputs):
+    def workload(**options):
+        run_program(load_program(filename), inputs, **options)
+    return workload
+
+
+def tight_loop(**options):
+    # counts cell 12 down to zero
+    program = [1101, 0, LOOP_COUNT, 12, 1001, 12, -1, 12, 1005, 12, 4, 99, 0]
+    run_program(program, [], **options)
+
+
+def day19_probe(**options):
+    vm = IntCode(load_program('day19_input.txt'), **options)
+    for n in range(PROBES):
+        vm.reset()
+        vm.run_until(inputs=[n % 50, n // 50])
+
+
+def day23_round(**options):
+    '''boot the 50 computers of day 23 and run one round of the network'''
+    program = load_program('day_23_input.txt')
+    vms = [IntCode(program, **options) for _ in range(50)]
+    for (address, vm) in enumerate(vms):
+        vm.reset()
+        vm.input.put(address)
+    scheduler = Scheduler(vms, lambda source, packet: [], packet_size=3, idle_input=-1)
+    for index in range(len(vms)):
+        scheduler.turn(index)
+    for index in range(len(vms)):
+        scheduler.turn(index)
+
+
+WORKLOADS = {
+    'day9_boost_test': program_workload('day9_input.txt', [1]),
+    'day9_sensor_boost': program_workload('day9_input.txt', [2]),
+    'day5_diagnostic': program_workload('day5_input.txt', [5]),
+    'tight_loop': tight_loop,
+    'day19_probe': day19_probe,
+    'day23_round': day23_round,
+}
+
+# workloads timed per repetition of their inner loop
+REPETITIONS = {
+    'day19_probe': PROBES,
+}
+
+
+def best_time(function, repeat):
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_workload(workload, repeat, options):
+    seconds = best_time(lambda: workload(**options), repeat)
+    profiler = Profiler()
+    workload(profiler=profiler, **options)
+    instructions = sum(profiler.opcodes.values())
+    return {
+        'seconds': seconds,
+        'instructions': instructions,
+        'instructions_per_second': instructions / seconds,
+    }
+
+
+def bench_startup(repeat, options):
+    '''seconds to create and reset a machine for the day 9 program'''
+    program = load_program('day9_input.txt')
+
+    def startup():
+        for _ in range(STARTUPS):
+            IntCode(program, **options).reset()
+
+    return {'seconds': best_time(startup, repeat) / STARTUPS}
+
+
+def bench_handoff(repeat, options):
+    '''round trip of one value through an echoing machine, on a thread and with run_until'''
+    echo = [3, 100, 4, 100, 1105, 1, 0]
+
+    vm = IntCode(echo, timeout=10, **options)
+    thread = threading.Thread(target=vm.run)
+    thread.start()
+
+    def threaded():
+        for n in range(HANDOFFS):
+            vm.input.put(n)
+            vm.output.get()
+
+    threaded_seconds = best_time(threaded, repeat) / HANDOFFS
+    vm.cancel()
+    thread.join()
+
+    vm = IntCode(echo, **options)
+    vm.reset()
+    vm.run_until()
+
+    def run_until():
+        for n in range(HANDOFFS):
+            vm.run_until(inputs=[n])
+
+    return {
+        'threaded_seconds': threaded_seconds,
+        'run_until_seconds': best_time(run_until, repeat) / HANDOFFS,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, repeat, options):
+    results = {}
+    for name in names:
+        results[name] = bench_workload(WORKLOADS[name], repeat, options)
+        if name in REPETITIONS:
+            results[name]['seconds_each'] = results[name]['seconds'] / REPETITIONS[name]
+        print(f'{name:20} {results[name]["seconds"] * 1000:10.2f} ms '
+              f'{results[name]["instructions_per_second"] / 1e6:8.2f} M instructions/s')
+    results['startup'] = bench_startup(repeat, options)
+    print(f'{"startup":20} {results["startup"]["seconds"] * 1e6:10.2f} us')
+    results['handoff'] = bench_handoff(repeat, options)
+    print(f'{"handoff threaded":20} {results["handoff"]["threaded_seconds"] * 1e6:10.2f} us')
+    print(f'{"handoff run_until":20} {results["handoff"]["run_until_seconds"] * 1e6:10.2f} us')
+    return results
+
+
+def compare(results, baseline):
+    '''print the time of every result relative to the baseline, below 1 is faster'''
+    for (name, result) in results.items():
+        for (key, value) in result.items():
+            old = baseline.get(name, {}).get(key)
+            if key.endswith('seconds') and old:
+                print(f'{name:20} {key:20} {value / old:6.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmarks of the IntCode machine')
+    parser.add_argument('workloads', nargs='*', metavar='workload',
+                        help=f'some of {", ".join(WORKLOADS)}, all by default')
+    parser.add_argument('--engine', default=intcode.ENGINE)
+    parser.add_argument('--memory-model', default=intcode.MEMORY_MODEL)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='JSON results to compare with')
+    args = parser.parse_args()
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f'unknown workloads {", ".join(sorted(unknown))}')
+
+    options = {'engine': args.engine, 'memory_model': args.memory_model}
+    results = run(args.workloads or list(WORKLOADS), args.repeat, options)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'options': options,
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f)['results'])
@@ -1,11 +1,10 @@
 import pytest
-from intcode import IntCode
+from intcode import AsciiTerminal, IntCode
 from typing import Tuple
 from collections import defaultdict
 import enum
 from day15 import Direction, DroidError
 from itertools import groupby, count
-from threading import Thread
 
 
 SCAFFOLD = '#'
@@ -54,30 +53,19 @@ class AftScaffoldingControl:
     def __init__(self, mode=1):
         self.brain = IntCode.create_from_source('day17_input.txt')
         self.brain.program[0] = mode
-        self.prg = Thread(target=self.brain.run)
-        self.prg.start()
+        self.terminal = AsciiTerminal(self.brain)
         self.scaffold = Scaffold()
         self.droid_location = None
 
 
     def read_camera(self,):
-        output = self.brain.output
-        y = 0
-        x = 0
         self.scaffold = Scaffold()
-        
-        while not output.empty() or not self.brain.finished:
-            pixel = output.get()
-            if pixel == 10:
-                y += 1
-                x = 0
-            else:
-                tile = chr(pixel)
-                self.scaffold.update_tile((x,y),chr(pixel))
+        for (y, line) in enumerate(self.terminal.read_lines()):
+            for (x, tile) in enumerate(line):
+                self.scaffold.update_tile((x,y), tile)
                 if tile in {'^', '>', '<', 'v'}:
                     self.droid_location = (x, y)
                     self.droid_direction = CHAR_TO_DIR[tile]
-                x += 1
 
         return bool(self.scaffold.tiles)
 
@@ -117,22 +105,12 @@ class AftScaffoldingControl:
                     loc = None
 
     def walk_scaffold(self, instruction):
-        cs = instruction + 'n\n'
-
-        for c in cs:
-            self.brain.input.put(ord(c))
-        while not self.brain.finished or not self.brain.output.empty():
-            line = ''
-            while True:
-                inp = self.brain.output.get(True, 10)
-                if inp == 10:
-                    print(line)
-                    break
-                if inp < 256:
-                    line = line + chr(inp)
-                else:
-                    print(f'output:{inp}')
-                    break
+        '''send the movement routine without video feed, returns the dust collected'''
+        for line in instruction.splitlines() + ['n']:
+            self.terminal.send_line(line)
+        for line in self.terminal.read_lines():
+            print(line)
+        return self.terminal.results[-1]
 
 
 def path_to_instructions(path, init_dir):
@@ -189,6 +167,6 @@ R,12,L,6,R,6,R,8,R,6
 L,8,R,8,R,6,R,12
 '''
     vacuum_droid = AftScaffoldingControl(mode=2)
-    vacuum_droid.walk_scaffold(main)
+    print(f'part2: {vacuum_droid.walk_scaffold(main)}')
 
 
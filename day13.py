@@ -1,6 +1,4 @@
-from intcode import IntCode
-import threading
-import queue
+from intcode import IntCode, Status
 import matplotlib.pyplot as plt
 import pygame
 import enum
@@ -20,6 +18,10 @@ HEIGHT = 24
 
 BLOCK_SIZE = 14
 
+# where the game program keeps the x of the ball and of the paddle
+BALL_X = 388
+PADDLE_X = 392
+
 colors = {
     Tile.EMPTY: (0, 0, 0),
     Tile.WALL: (0, 0, 255),
@@ -39,6 +41,9 @@ class Arcade():
 
     def __init__(self, program):
         self.computer = IntCode(program)
+        # the joystick position for the next run of the game
+        self.joystick = []
+        self.computer.watch(BALL_X, PADDLE_X + 1, self.track)
         self.clear_board()
         self.score = 0
         self.ball = (WIDTH//2, HEIGHT//2)
@@ -61,6 +66,14 @@ class Arcade():
             elif tile == Tile.PADDLE:
                 self.paddle = loc
 
+    def track(self, changes):
+        '''follow the ball and the paddle in the memory of the game'''
+        for (address, value) in changes:
+            if address == BALL_X:
+                self.ball = (value, self.ball[1])
+            elif address == PADDLE_X:
+                self.paddle = (value, self.paddle[1])
+
     def determine_action(self):
         ball_x = self.ball[0]
         paddle_x = self.paddle[0]
@@ -90,13 +103,14 @@ class Arcade():
 
         
     def update_game(self):
-        while not self.computer.output.empty():
-            x = self.computer.output.get(True, 1)
-            y = self.computer.output.get(True, 1)
-            data = self.computer.output.get(True, 1)
+        '''run the game until it reads the joystick again, returns its status'''
+        (status, values) = self.computer.run_until(inputs=self.joystick)
+        for i in range(0, len(values) - 2, 3):
+            (x, y, data) = values[i:i + 3]
             self.update_game_state((x,y), data)
-        action = self.determine_action()
-        self.computer.input.put(action)
+        # ball and paddle are up to date, the watch delivered them at the input
+        self.joystick = [self.determine_action()] if status == Status.INPUT else []
+        return status
 
 
     def game_loop(self):
@@ -108,16 +122,10 @@ class Arcade():
                 if event.type == pygame.QUIT:
                     done = True
             clock.tick(60)
-            try:
-                if not self.computer.output.empty():
-                    self.update_game()
-                    self.draw_screen()
-                    pygame.display.flip()
-            except queue.Empty:
-                print('output queue empty')
-                done = True
-            
-            if self.computer.finished and self.computer.output.empty():
+            status = self.update_game()
+            self.draw_screen()
+            pygame.display.flip()
+            if status != Status.INPUT:
                 done = True
         print('game loop stopped')
 
@@ -130,12 +138,10 @@ class Arcade():
         pygame.init()
         self.screen = pygame.display.set_mode((640, 480))
         self.clear_board()
-        game = threading.Thread(target=self.computer.run)
-        game.start()
+        self.computer.reset()
+        self.joystick = []
         self.game_loop()
         print('game finished')
-        game.join()
-        print('program thread joined')
         pygame.quit()
 
 
@@ -3,12 +3,8 @@ import intcode
 import enum
 import queue
 import heapq
-import threading
 from collections import defaultdict
 from typing import Tuple
-import sys 
-
-sys.setrecursionlimit(10000)
 
 class DroidError(Exception):
     pass
@@ -92,43 +88,32 @@ class RepairDroid():
     brain: intcode.IntCode
 
     def __init__(self):
-        self.brain = intcode.IntCode.create_from_source('day15_input.txt')
+        self.brain = intcode.IntCode.create_from_source('day15_input.txt', memory_model='paged')
         self.deck = Deck()
         self.location = (0, 0)
 
 
-    def take_step(self, direction: Direction) -> bool:
-        '''move the droid and return true if actually moved'''
-        new_location = direction.move(self.location)
-        self.brain.input.put(direction.value)
-        tile = Tile(self.brain.output.get())
-        self.deck.update_tile(new_location, tile)
-        if tile == Tile.WALL:
-            return False
-        else:
-            self.location = new_location
-            if tile == Tile.OXYGEN_SYSTEM:
-                self.oxygen_system_location = self.location
-            return True
-
-
-    def wander(self, direction: Direction):
-        if self.take_step(direction):
-            for dir in Direction:
-                if not self.deck.get_tile(dir.move(self.location)):
-                    self.wander(dir)
-            self.take_step(direction.back())
-        #self.show_maze()
-
-
     def map_maze(self):
-        prg = threading.Thread(target=self.brain.run)
-        prg.start()
+        '''breadth first exploration, forking the brain for every step'''
+        self.brain.reset()
         self.deck.update_tile(self.location, Tile.FLOOR)
-        for dir in Direction:
-            self.wander(dir)
-        self.brain.finished = True
-        prg.join()
+        frontier = [(self.location, self.brain)]
+        while frontier:
+            next_frontier = []
+            for (location, brain) in frontier:
+                for direction in Direction:
+                    new_location = direction.move(location)
+                    if self.deck.get_tile(new_location):
+                        continue
+                    droid = brain.fork()
+                    (_, outputs) = droid.run_until(inputs=[direction.value])
+                    tile = Tile(outputs[0])
+                    self.deck.update_tile(new_location, tile)
+                    if tile == Tile.OXYGEN_SYSTEM:
+                        self.oxygen_system_location = new_location
+                    if tile != Tile.WALL:
+                        next_frontier.append((new_location, droid))
+            frontier = next_frontier
 
     def show_maze(self):
         for line in self.deck.show_deck():
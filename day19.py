@@ -1,30 +1,24 @@
 import numpy as np 
-from intcode import IntCode
-import threading
+from intcode import Query, load_program
+from intcode_batch import BatchIntCode
 import pytest
 from matplotlib import pyplot as plt
 
 class DroneSystem:
     
     def __init__(self):
-        self.computer = IntCode.create_from_source('day19_input.txt')
+        self.program = load_program('day19_input.txt')
+        self.query = Query(self.program, engine='compiled', memory_model='paged')
 
     def measure(self, x, y):
-        self.prg = threading.Thread(target=self.computer.run)
-        self.prg.start()
-        self.computer.input.put(x)
-        self.computer.input.put(y)
-        out = self.computer.output.get()
-        #print(f'out: {out}')
-        self.prg.join()
-        return out
+        return self.query(x, y)[0]
 
     def scan(self, area):
         (x_max, y_max) = area.shape
-        for x in range(x_max):
-            for y in range(y_max):
-                measure = self.measure(x, y)
-                area[y][x] = measure
+        points = [(x, y) for x in range(x_max) for y in range(y_max)]
+        results = BatchIntCode(self.program).run(points)
+        for ((x, y), (_, outputs)) in zip(points, results):
+            area[y][x] = outputs[0]
 
     def track_edges(self):
         x = 22
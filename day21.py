@@ -1,37 +1,27 @@
 import intcode
-import queue
-import threading
 
 class SpringDroid():
 
     def __init__(self):
-        self.computer = intcode.IntCode.create_from_source('day21_input.txt')
+        self.terminal = intcode.AsciiTerminal(intcode.IntCode.create_from_source('day21_input.txt'))
 
     def __enter__(self):
-        self.prg = threading.Thread(target=self.computer.run)
-        self.prg.start()
+        self.terminal.reset()
         return self
 
     def __exit__(self, _type, _value, _tb):
-        self.computer.finished = True
-        self.prg.join()
+        pass
 
     def show_output(self):
-        while True:
-            try:
-                c = self.computer.output.get(True, 10)
-                if c < 128:
-                    print(chr(c), sep='', end='')
-                else:
-                    print(f'output: {c}')
-            except queue.Empty:
-                break
+        for line in self.terminal.read_lines():
+            print(line)
+        for result in self.terminal.results:
+            print(f'output: {result}')
+        self.terminal.results.clear()
 
     def input_line(self, line):
         print(f'In: {line}')
-        for c in line:
-            self.computer.input.put(ord(c))
-        self.computer.input.put(10)
+        self.terminal.send_line(line)
 
 spring_droid = SpringDroid()
 with spring_droid as droid:
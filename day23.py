@@ -1,8 +1,5 @@
 import pytest
-from intcode import IntCode
-import queue
-import threading
-import time
+from intcode import IntCode, Scheduler
 import logging
 
 
@@ -12,57 +9,12 @@ class Computer():
         self.network = network
         self.address = address
         self.core = IntCode.create_from_source('day23_input.txt')
-        self.core.output = self
-        self.core.input = self
-        self.out_packet = ()
-        self.input = queue.Queue()
-        self.input.put(address)
 
     def boot(self):
-        self.prg = threading.Thread(target=self.core.run)
-        self.prg.start()
+        self.core.reset()
+        self.core.input.put(self.address)
         logging.info(f'{self} started')
 
-    def shutdown(self):
-        self.core.finished = True
-        self.prg.join()
-        logging.info(f'{self} stopped')
-
-    def listen_network(self, packet):
-        (addr, x, y) = packet
-        if addr == self.address:
-            logging.debug(f'computer({addr}) received {x}, {y}')
-            self.input.put(x)
-            self.input.put(y)
-      
-    def put(self, input):
-        ''' ducktype as queue
-        
-        Note that this method will run int the core thread.
-        '''
-        time.sleep(0.05)
-        self.out_packet += (input,)
-        if len(self.out_packet) == 3:
-            network.queue.put(self.out_packet)
-            self.out_packet = ()
-
-      
-    def get(self, block, timeout):
-        ''' ducktype as queue
-        
-        Note that this method will run int the core thread.
-        '''
-        time.sleep(0.05)
-        if self.input.empty():
-            return -1
-        else:
-            return self.input.get(block, timeout)
-
-
-    @property
-    def is_idle(self):
-        return self.input.empty() and self.out_packet == ()
-
     @property
     def name(self):
         return f'computer_{self.address}'
@@ -75,66 +27,69 @@ class Nat():
     def __init__(self, network):
         self.x = None
         self.y = None
+        self.first_y = None
         self.last_y_sent = None
+        self.repeated_y = None
         self.network = network
 
     def listen_network(self, packet):
         (addr, x, y) = packet
         logging.info('Nat received %s, %s was %s, %s', x, y, self.x, self.y)
+        if self.first_y is None:
+            self.first_y = y
         self.x = x
         self.y = y
         
     def check_activity(self):
-        time.sleep(0.15)
-        computers = self.network.computers
-        computers_idle = all(computers[address].is_idle for address in computers)
-        network_idle = self.network.queue.empty()
-        if network_idle and computers_idle and self.x and self.y:
-            network.queue.put((0, self.x, self.y))
-            logging.info('Nat sent idle packet (0, %s, %s)', self.x, self.y)
-            if self.y == self.last_y_sent:
-                logging.warning('Nat sent duplicate y : %s', self.y)
-            self.last_y_sent = self.y 
+        '''called when the whole network is idle, returns False to stop it
+
+        Wakes computer 0 with the last packet received, and stops the network
+        once it sends the same y twice in a row.
+        '''
+        if self.y is None:
+            return False
+        self.network.scheduler.send(0, [self.x, self.y])
+        logging.info('Nat sent idle packet (0, %s, %s)', self.x, self.y)
+        if self.y == self.last_y_sent:
+            logging.warning('Nat sent duplicate y : %s', self.y)
+            self.repeated_y = self.y
+            return False
+        self.last_y_sent = self.y
+        return True
 
 
 class Network():
+    '''the computers on one thread, every one runs until it waits for input
+
+    A computer is idle once it read -1 from its empty input without sending
+    anything since, so the NAT sees exactly when the network is idle.
+    '''
 
     def __init__(self, n):
         self.computers = {}
         for address in range(n):
             computer = Computer(self, address)
             self.computers[address] = computer
-        self.queue = queue.Queue()
         self.nat = Nat(self)
+        self.scheduler = Scheduler([computer.core for computer in self.computers.values()],
+                                   self.route, packet_size=3, idle_input=-1,
+                                   on_idle=self.nat.check_activity)
+
+    def route(self, source, packet):
+        (address, x, y) = packet
+        logging.debug(f'computer({address}) received {x}, {y}')
+        if address in self.computers:
+            return [(address, [x, y])]
+        elif address == 255:
+            self.nat.listen_network(packet)
+        else:
+            logging.error(f'Undeliverable packet: {packet}')
+        return []
 
     def boot(self):
-        computers = self.computers
-        for address in computers:
+        for address in self.computers:
             self.computers[address].boot()
-
-        idle_timer = 25
-        while not all(computers[address].core.finished for address in computers):
-            time.sleep(0.05)
-            
-            try:
-                packet = self.queue.get(False)
-                (address, x, y) = packet
-                idle_timer = 25
-                if address in computers:
-                    computers[address].listen_network(packet)
-                elif address == 255:
-                    self.nat.listen_network(packet)
-                else:
-                    logging.error(f'Undeliverable packet: {packet}')
-            except queue.Empty:
-                logging.debug(f'network queue empty')
-                idle_timer -= 1
-                if idle_timer < 0:
-                    self.nat.check_activity()
-
-
-        for address in computers:
-            self.computers[address].shutdown()
+        self.scheduler.run()
         logging.info(f'network shutdown')
 
 def test_create_network():
@@ -147,10 +102,19 @@ def test_network_addresses():
     for addr in network.computers.keys():
         assert network.computers[addr].address == addr
 
+
+def test_nat():
+    network = Network(50)
+    network.boot()
+    assert network.nat.first_y is not None
+    assert network.nat.repeated_y == network.nat.last_y_sent
+
 if __name__ == '__main__':
     logging.basicConfig(filename='day23.log', level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     logging.info('************ Network starting ************')
     #pytest.main([__file__])
 
     network = Network(50)
-    network.boot()
\ No newline at end of file
+    network.boot()
+    print(f'part1: {network.nat.first_y}')
+    print(f'part2: {network.nat.repeated_y}')
\ No newline at end of file
@@ -1,9 +1,6 @@
-from intcode import IntCode
-from threading import Thread
-from queue import Queue
-from collections import defaultdict
+from intcode import AsciiTerminal, IntCode, IntCodeError, Status
+from collections import defaultdict, deque
 import itertools as it
-import time
 import re
 import logging
 import networkx as nx
@@ -12,57 +9,38 @@ import pickle
 class Computer():
 
     def __init__(self):
-        self.core = IntCode.create_from_source('day25_input.txt', timeout=30)
-        self.core.output = self
-        self.core.input = self
-        self.queue = Queue()
-        self.command_buffer = []
-        self.line = ""
+        self.terminal = AsciiTerminal(IntCode.create_from_source('day25_input.txt'))
+        self.lines = deque()
         self.items = set()
         self.room = 'Hull Breach'
 
+    @property
+    def finished(self):
+        return self.terminal.status == Status.HALT and not self.lines
+
     def boot(self):
-        self.prg = Thread(target=self.core.run)
-        self.prg.start()
+        self.terminal.reset()
         logging.info(f'{self} started')
 
     def shutdown(self):
-        self.core.finished = True
-        self.prg.join()
         logging.info(f'{self} stopped')
 
     def command(self, command):
-        self.command_buffer = [ord(c) for c in command]
-        self.command_buffer.append(10)
+        self.terminal.send_line(command)
         print(f'> {command}')
-    
-    def put(self, input):
-        ''' ducktype as queue
-        
-        Note that this method will run int the core thread.
-        '''
-        self.line += chr(input)
-        if input == 10:
-            print(f'< {self.line}')
-            self.queue.put(self.line)
-            self.line = ""
-      
-    def get(self, block, timeout):
-        ''' ducktype as queue
-        
-        Note that this method will run int the core thread.
-        '''
-        while not self.command_buffer:
-            time.sleep(0.05)
-
-        (code, *rest) = self.command_buffer
-        self.command_buffer = rest
-        return code
 
+    def read_line(self):
+        if not self.lines:
+            self.lines.extend(self.terminal.read_lines())
+        if not self.lines:
+            raise IntCodeError(f'no more output, program stopped with {self.terminal.status!r}')
+        line = self.lines.popleft()
+        print(f'< {line}')
+        return line + '\n'
 
     @property
     def is_idle(self):
-        return self.queue.empty() and not self.command
+        return not self.lines
 
     @property
     def name(self):
@@ -72,15 +50,11 @@ class Computer():
         return self.name
 
 def manual_interaction():
-    while not computer.core.finished:
-        time.sleep(0.05)
-        try:
-            line = computer.queue.get()
-            print(line, end='')
-            if line.strip() == 'Command?':
-                computer.command(input())
-        except Empty:
-            pass
+    while not computer.finished:
+        line = computer.read_line()
+        print(line, end='')
+        if line.strip() == 'Command?':
+            computer.command(input())
 
 ITEM_BLACKLIST=['infinite loop', 'giant electromagnet', 'escape pod', 'molten lava', 'photons']
 
@@ -93,8 +67,8 @@ def parse_description(computer, G):
     category = None
     doors = nx.get_node_attributes(G, 'rooms')
     items = nx.get_node_attributes(G, 'items')
-    while True:
-        line = computer.queue.get().strip()
+    while not computer.finished:
+        line = computer.read_line().strip()
         m = re.match(RE_ROOM, line)
         if m:
             room = m.group(1)
@@ -117,14 +91,16 @@ def parse_description(computer, G):
             if category == 'items':
                 items[room].add(thing)
         if line == 'Command?':
-            computer.room = room
-            nx.set_node_attributes(G, doors, 'doors')
-            nx.set_node_attributes(G, items, 'items')
-            return room
+            break
+    computer.room = room
+    nx.set_node_attributes(G, doors, 'doors')
+    nx.set_node_attributes(G, items, 'items')
+    return room
+
 def wait_for_prompt(computer):
     line = ''
     while line != 'Command?':
-        line = computer.queue.get().strip()
+        line = computer.read_line().strip()
     
 
 def explore(computer, G, dir=None):
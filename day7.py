@@ -1,28 +1,28 @@
-from intcode import IntCode
+from intcode import AsyncIntCode, IntCodePool
 import pytest
-import threading
-import queue
+import asyncio
 
+# machine pools per program, shared by all the pipelines
+pools = {}
 
-def create_amps(source, configuration):
-    amps = [IntCode(source) for _ in range(5)]
+
+async def run_amps(source, configuration, signal):
+    pool = pools.get(tuple(source))
+    if pool is None:
+        pool = pools[tuple(source)] = IntCodePool(source, engine='table', memory_model='paged')
+    channels = [asyncio.Queue() for _ in range(6)]
     for i in range(5):
-        amps[i].input.put(configuration[i])
-    amps[0].output = lambda x: amps[1].input.put(x)
-    amps[1].output = lambda x: amps[2].input.put(x)
-    amps[2].output = lambda x: amps[3].input.put(x)
-    amps[3].output = lambda x: amps[4].input.put(x)
-    amps[4].out_queue = queue.Queue()
-    amps[4].output = lambda x: amps[i].out_queue.put(x)
-    return amps
+        channels[i].put_nowait(configuration[i])
+    channels[0].put_nowait(signal)
+    machines = [pool.acquire() for _ in range(5)]
+    amps = [AsyncIntCode(machines[i], channels[i], channels[i+1]) for i in range(5)]
+    await asyncio.gather(*(amp.run(reset=False) for amp in amps))
+    for vm in machines:
+        pool.release(vm)
+    return channels[5].get_nowait()
 
 def thuster_output(source, configuration, signal):
-    amps = create_amps(source, configuration)
-    for amp in amps:
-        amp.thread = threading.Thread(target=amp.run)
-        amp.thread.start()
-    amps[0].input.put(signal) 
-    return amps[4].out_queue.get()
+    return asyncio.run(run_amps(source, configuration, signal))
     
     
 def all_configs():
@@ -1,7 +1,34 @@
-from enum import Enum, IntEnum
+from enum import Enum, IntEnum, IntFlag
+from typing import Callable, NamedTuple
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from array import array
+import asyncio
+import json
+import mmap
+import os
 import queue
+import struct
+import sys
+import threading
+import time
+import weakref
 
 TIMEOUT = 2
+ENGINE = 'decode'
+MEMORY_MODEL = 'list'
+# instructions executed between checks of the run loop
+QUANTUM = 10000
+PAGE_BITS = 10
+PAGE_SIZE = 1 << PAGE_BITS
+
+# binary programs: header, int64 cells, then the escaped values as text
+BINARY_SUFFIX = '.icb'
+BINARY_HEADER = struct.Struct('<4sQQ')
+BINARY_MAGIC = b'ICB1'
+BIGINT = -2**63
 
 class OpCode(Enum):
     ADD = 1
@@ -15,21 +42,397 @@ class OpCode(Enum):
     RPA = 9
     END = 99
 
+LENGTHS = {
+    OpCode.ADD: 4,
+    OpCode.MULT: 4,
+    OpCode.IN: 2,
+    OpCode.OUT: 2,
+    OpCode.JMPIFT: 3,
+    OpCode.JMPIFF: 3,
+    OpCode.LT: 4,
+    OpCode.EQL: 4,
+    OpCode.RPA: 2,
+    OpCode.END: 1,
+}
+
+# parameters read as values, the others are addresses written to
+OPERANDS = {
+    OpCode.ADD: 2,
+    OpCode.MULT: 2,
+    OpCode.IN: 0,
+    OpCode.OUT: 1,
+    OpCode.JMPIFT: 2,
+    OpCode.JMPIFF: 2,
+    OpCode.LT: 2,
+    OpCode.EQL: 2,
+    OpCode.RPA: 1,
+    OpCode.END: 0,
+}
+
 class OpFlags(IntEnum):
     POSITIONAL = 0
     IMMEDIATE = 1
     RELATIVE = 2
 
 
+class Status(IntFlag):
+    '''why IntCode.run_until returned control'''
+    INPUT = 1
+    OUTPUT = 2
+    HALT = 4
+    LIMIT = 8
+    CANCELLED = 16
+
+
 class IntCodeError(Exception):
     pass
 
 
+class Paused(Exception):
+    '''raised by the I/O instructions to leave the engine in run_until'''
+
+    def __init__(self, status, ip):
+        super().__init__(status, ip)
+        self.status = status
+        self.ip = ip
+
+
+# put on the input queue to wake a machine blocked waiting for input
+CANCEL = object()
+
+
+class CancelToken:
+    '''cancels all the machines created with it, from any thread'''
+
+    def __init__(self):
+        self.cancelled = False
+        self.machines = weakref.WeakSet()
+
+    def cancel(self):
+        self.cancelled = True
+        for vm in list(self.machines):
+            vm.cancel()
+
+
+class Channel:
+    '''bulk I/O between a machine and its peer, in place of a queue.Queue
+
+    Values go into an int64 array, which becomes a list once a value does not
+    fit. drain() takes everything pending at once without copying. put, get
+    and empty behave like queue.Queue, so a Channel can be the input or the
+    output of a machine.
+    '''
+
+    def __init__(self, values=()):
+        self.buffer = array('q')
+        # values before start were taken by get
+        self.start = 0
+        self.interrupted = False
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.extend(values)
+
+    def put(self, value, block=True, timeout=None):
+        with self.lock:
+            try:
+                self.buffer.append(value)
+            except OverflowError:
+                self.buffer = self.buffer.tolist()
+                self.buffer.append(value)
+            if self.waiting:
+                self.ready.notify()
+
+    def extend(self, values):
+        with self.ready:
+            try:
+                self.buffer.extend(values)
+            except OverflowError:
+                self.buffer = self.buffer.tolist()
+                self.buffer.extend(values)
+            if self.waiting:
+                self.ready.notify_all()
+
+    def wait(self, block, timeout):
+        '''wait for a value, returns False on timeout or when interrupted'''
+        if self.start < len(self.buffer) or not block:
+            return self.start < len(self.buffer)
+        self.waiting += 1
+        try:
+            self.ready.wait_for(lambda: self.start < len(self.buffer) or self.interrupted, timeout)
+        finally:
+            self.waiting -= 1
+        return self.start < len(self.buffer)
+
+    def get(self, block=True, timeout=None):
+        with self.ready:
+            if not self.wait(block, timeout):
+                if self.interrupted:
+                    self.interrupted = False
+                    return CANCEL
+                raise queue.Empty
+            value = self.buffer[self.start]
+            self.start += 1
+            if self.start == len(self.buffer):
+                del self.buffer[:]
+                self.start = 0
+            return value
+
+    def drain(self, block=False, timeout=None):
+        '''all pending values as an array, a list or a memoryview of an array
+
+        The values are no longer referenced by the channel, so the result is
+        not copied unless some values were already taken by get. With block it
+        waits for at least one value, an empty result means a timeout.
+        '''
+        with self.ready:
+            self.wait(block, timeout)
+            (values, start) = (self.buffer, self.start)
+            self.buffer = array('q') if isinstance(values, array) else []
+            self.start = 0
+        if start == 0:
+            return values
+        elif isinstance(values, array):
+            return memoryview(values)[start:]
+        else:
+            return values[start:]
+
+    def interrupt(self):
+        '''wake a consumer blocked in get, which returns CANCEL'''
+        with self.ready:
+            self.interrupted = True
+            self.ready.notify_all()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def qsize(self):
+        with self.ready:
+            return len(self.buffer) - self.start
+
+    def pending(self):
+        with self.ready:
+            return tuple(self.buffer[self.start:])
+
+
+class Watch(NamedTuple):
+    '''a memory region watched by IntCode.watch, values as last delivered'''
+    start: int
+    stop: int
+    callback: Callable
+    values: list
+
+
+class Taint:
+    '''which cells and instructions of a run depend on which input values
+
+    Input k labels the cell it is stored in with k. An instruction depends on
+    the labels of its own cells, of the cells it reads, of the relative base
+    when it addresses relative to it and of the last jump condition, and its
+    result cell gets them. on_first_use(labels, vm) is called before the first instruction
+    depending on each label.
+    '''
+
+    def __init__(self, on_first_use=None):
+        self.cells = {}
+        self.base = frozenset()
+        self.control = frozenset()
+        # the number of inputs read, and the cell every input went to
+        self.inputs = 0
+        self.stored = {}
+        self.used = frozenset()
+        self.instructions = {}
+        self.on_first_use = on_first_use
+
+
+class Instruction(NamedTuple):
+    '''decoded instruction, cached per instruction pointer'''
+    op: OpCode
+    fa: OpFlags
+    fb: OpFlags
+    fc: OpFlags
+    handler: Callable
+
+
+class PagedMemory:
+    '''sparse memory, pages are only allocated when first written
+
+    Pages holding the program are shared with the pristine program image until
+    they are written, so a reset only has to drop the touched pages.
+    '''
+
+    def __init__(self, program):
+        self.program = list(program)
+        self.image = {}
+        for start in range(0, len(program), PAGE_SIZE):
+            page = self.program[start:start + PAGE_SIZE]
+            self.image[start >> PAGE_BITS] = page + [0] * (PAGE_SIZE - len(page))
+        self.pages = dict(self.image)
+        # pages differing from the image, and the ones not shared with a copy
+        self.touched = set()
+        self.owned = set()
+
+    def __getitem__(self, address):
+        page = self.pages.get(address >> PAGE_BITS)
+        return 0 if page is None else page[address & (PAGE_SIZE - 1)]
+
+    def __setitem__(self, address, value):
+        n = address >> PAGE_BITS
+        if n not in self.owned:
+            page = self.pages.get(n)
+            self.pages[n] = [0] * PAGE_SIZE if page is None else page.copy()
+            self.owned.add(n)
+            self.touched.add(n)
+        self.pages[n][address & (PAGE_SIZE - 1)] = value
+
+    def copy(self):
+        '''copy on write: both memories share all pages until they write them'''
+        other = PagedMemory.__new__(PagedMemory)
+        other.program = self.program
+        other.image = self.image
+        other.pages = dict(self.pages)
+        other.touched = set(self.touched)
+        other.owned = set()
+        self.owned = set()
+        return other
+
+    def reset(self, program):
+        if program != self.program:
+            self.__init__(program)
+            return
+        for n in self.touched:
+            if n in self.image:
+                self.pages[n] = self.image[n]
+            else:
+                del self.pages[n]
+        self.touched.clear()
+        self.owned.clear()
+
+
+class Snapshot(NamedTuple):
+    '''state of an IntCode machine, see IntCode.snapshot'''
+    ip: int
+    rp: int
+    memory: object
+    blocks: dict
+    block_sizes: dict
+    code_cells: dict
+    input: tuple
+    output: tuple
+
+
+def copy_memory(memory):
+    return memory[:] if isinstance(memory, array) else memory.copy()
+
+
+def int64_image(program, headroom):
+    '''the program followed by headroom zeroes as an int64 array, None if it does not fit'''
+    try:
+        image = array('q', program)
+    except OverflowError:
+        return None
+    image.frombytes(bytes(8 * headroom))
+    return image
+
+
+def pending(channel):
+    '''the values waiting in a queue, without taking them out'''
+    if isinstance(channel, Channel):
+        return channel.pending()
+    if not isinstance(channel, queue.Queue):
+        raise IntCodeError(f'cannot snapshot values pending in {channel}')
+    with channel.mutex:
+        return tuple(channel.queue)
+
+
+class Profiler:
+    '''counts executed opcodes and addresses, and time spent waiting for input
+
+    Call stacks are guessed from the relative base: a positive adjustment is
+    taken as the prologue of a function, named after its address, and a
+    negative one as its epilogue.
+    '''
+
+    def __init__(self):
+        self.opcodes = Counter()
+        self.ips = Counter()
+        self.stacks = Counter()
+        self.frames = []
+        self.stack = 'main'
+        self.input_time = 0.0
+        self.compute_time = 0.0
+
+    def enter(self, ip):
+        self.frames.append(f'fn@{ip}')
+        self.stack = ';'.join(['main'] + self.frames)
+
+    def leave(self):
+        if self.frames:
+            self.frames.pop()
+        self.stack = ';'.join(['main'] + self.frames)
+
+    def report(self, limit=10):
+        total = sum(self.opcodes.values())
+        lines = [f'instructions: {total}',
+                 f'compute: {self.compute_time:.3f}s',
+                 f'waiting for input: {self.input_time:.3f}s',
+                 '',
+                 'opcode       count']
+        lines += [f'{op.name:8} {count:9d}' for (op, count) in self.opcodes.most_common()]
+        lines += ['', 'ip           count']
+        lines += [f'{ip:8d} {count:9d}' for (ip, count) in self.ips.most_common(limit)]
+        return '\n'.join(lines)
+
+    def write_collapsed(self, filename):
+        '''write the stacks in the collapsed format of flamegraph.pl'''
+        with open(filename, 'w') as f:
+            for (stack, count) in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class TraceEntry(NamedTuple):
+    '''an executed instruction with its operand values and its result
+
+    The result is the value stored, input or output, or the new instruction
+    pointer for jumps and the new relative base for RPA.
+    '''
+    ip: int
+    op: OpCode
+    operands: tuple
+    result: object
+
+
+class IOLog:
+    '''every value consumed from input and produced as output, in order'''
+
+    def __init__(self, events=None):
+        self.events = events or []
+
+    @property
+    def inputs(self):
+        return [value for (status, value) in self.events if status == Status.INPUT]
+
+    @property
+    def outputs(self):
+        return [value for (status, value) in self.events if status == Status.OUTPUT]
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump([(int(status), value) for (status, value) in self.events], f)
+
+    @classmethod
+    def load(cls, filename) -> 'IOLog':
+        with open(filename, 'r') as f:
+            return IOLog([(Status(status), value) for (status, value) in json.load(f)])
+
+
 class IntCode:
 
-    def __init__(self, program, timeout=TIMEOUT):
+    def __init__(self, program, timeout=TIMEOUT, engine=None, memory_model=None,
+                 profiler=None, trace=None, iolog=None,
+                 max_instructions=None, max_time=None, token=None, taint=None):
         self.name = 'IntCode'
-        self.program = program.copy()
+        self.program = list(program)
         self.memory = []
         self.input = queue.Queue()
         self.output = queue.Queue()
@@ -37,6 +440,63 @@ class IntCode:
         self.finished = False
         self.rp = 0
         self.timeout = timeout
+        self.profiler = profiler
+        # TraceEntry of the instructions executed, trace=N keeps the last N
+        if isinstance(trace, int):
+            trace = deque(maxlen=trace)
+        self.trace = trace
+        self.iolog = iolog
+        self.taint = taint
+        # hard limits from reset(), checked every QUANTUM instructions
+        self.max_instructions = max_instructions
+        self.max_time = max_time
+        self.executed = 0
+        self.deadline = None
+        self.token = token
+        if token is not None:
+            token.machines.add(self)
+        self.cancelled = False
+        # an input value to store again after promoting array memory
+        self.unread = None
+        self.watches = []
+        # outputs of run_until, None when running threaded on the queues
+        self.batch = None
+        self.stop = Status.INPUT | Status.HALT
+        self.decoded = {}
+        self.blocks = {}
+        self.block_sizes = {}
+        self.code_cells = {}
+        # executions per kind of superinstruction on the fused engine
+        self.fusions = Counter()
+        self.engines = {
+            'decode': self.execute_decoded,
+            'table': self.execute_table,
+            'compiled': self.execute_compiled,
+            # superinstructions of intcode_peephole run like compiled blocks
+            'fused': self.execute_compiled,
+        }
+        self.engine = engine or ENGINE
+        if self.engine not in self.engines:
+            raise IntCodeError(f'unknown engine {self.engine}')
+        self.memory_model = memory_model or MEMORY_MODEL
+        if self.memory_model not in ('list', 'paged', 'array'):
+            raise IntCodeError(f'unknown memory model {self.memory_model}')
+        # the initial array memory, None when the program does not fit int64,
+        # and the program it was built from as the program can be edited
+        self.image = None
+        self.image_program = None
+        self.handlers = {
+            OpCode.ADD: self.op_add,
+            OpCode.MULT: self.op_mult,
+            OpCode.IN: self.op_in,
+            OpCode.OUT: self.op_out,
+            OpCode.JMPIFT: self.op_jmpift,
+            OpCode.JMPIFF: self.op_jmpiff,
+            OpCode.LT: self.op_lt,
+            OpCode.EQL: self.op_eql,
+            OpCode.RPA: self.op_rpa,
+            OpCode.END: self.op_end,
+        }
 
     def target(self, par, flags):
         if flags == OpFlags.POSITIONAL:
@@ -53,87 +513,998 @@ class IntCode:
             return self.memory[self.target(par, flags)]
 
     def store(self, par, flags, value):
-        self.memory[self.target(par, flags)] = value
+        address = self.target(par, flags)
+        self.memory[address] = value
+        if address in self.code_cells:
+            self.invalidate(address)
+
+    def invalidate(self, address):
+        '''self-modifying code: forget decodings and blocks covering the cell'''
+        for ip in self.code_cells.pop(address, ()):
+            self.decoded.pop(ip, None)
+            self.blocks.pop(ip, None)
 
     def operation(self, ip):
-        (op, fa, fb, fc) = self.parse_operation(self.memory[ip])
-        if op == OpCode.ADD:
-            [a, b, to] = self.memory[ip+1:ip+4]
-            result = self.fetch(a, fa) + self.fetch(b, fb)
-            self.store(to, fc, result)
-            return ip + 4
-        elif op == OpCode.MULT:
-            [a, b, to] = self.memory[ip+1:ip+4]
-            result = self.fetch(a, fa) * self.fetch(b, fb)
-            self.store(to, fc, result)
-            return ip + 4
-        elif op == OpCode.IN:
-            to = self.memory[ip+1]
-            result = None
-            while not self.finished:
-                try:
-                    result = self.input.get(True, self.timeout)
-                    break
-                except queue.Empty:
-                    pass
-                    if self.finished:
-                        return None
+        (op, fa, fb, fc, handler) = self.decoded.get(ip) or self.decode(ip)
+        return handler(ip, fa, fb, fc)
+
+    def decode(self, ip):
+        raw = self.memory[ip]
+        try:
+            (op, fa, fb, fc) = self.parse_operation(raw)
+        except ValueError:
+            raise IntCodeError(f'illegal opcode {raw}')
+        instruction = Instruction(op, fa, fb, fc, self.handlers[op])
+        self.decoded[ip] = instruction
+        self.code_cells[ip] = self.code_cells.get(ip, ()) + (ip,)
+        return instruction
+
+    def op_add(self, ip, fa, fb, fc):
+        memory = self.memory
+        result = self.fetch(memory[ip+1], fa) + self.fetch(memory[ip+2], fb)
+        self.store(memory[ip+3], fc, result)
+        return ip + 4
+
+    def op_mult(self, ip, fa, fb, fc):
+        memory = self.memory
+        result = self.fetch(memory[ip+1], fa) * self.fetch(memory[ip+2], fb)
+        self.store(memory[ip+3], fc, result)
+        return ip + 4
+
+    def op_in(self, ip, fa, fb, fc):
+        # while waiting for input the machine can be snapshot at this instruction
+        self.ip = ip
+        if self.watches:
+            self.deliver_watches()
+        to = self.memory[ip+1]
+        self.check_limits(ip)
+        (result, self.unread) = (self.unread, None)
+        if result is None and self.batch is not None:
+            try:
+                result = self.input.get(False)
+                while result is CANCEL:
+                    # left over from an earlier cancel
+                    result = self.input.get(False)
+            except queue.Empty:
+                raise Paused(Status.INPUT, ip)
+        while result is None and not self.finished:
+            try:
+                result = self.input.get(True, self.timeout)
+            except queue.Empty:
+                if self.finished:
+                    return None
+            if result is CANCEL:
+                result = None
+            self.check_limits(ip)
+        try:
             self.store(to, fa, result)
-            return ip + 2
-        elif op == OpCode.OUT:
-            a = self.memory[ip+1]
-            out = self.fetch(a, fa)
+        except OverflowError:
+            # executed again once resume() promoted the memory
+            self.unread = result
+            raise
+        if self.iolog is not None:
+            self.iolog.events.append((Status.INPUT, result))
+        return ip + 2
+
+    def op_out(self, ip, fa, fb, fc):
+        if self.watches:
+            self.deliver_watches()
+        out = self.fetch(self.memory[ip+1], fa)
+        if self.iolog is not None:
+            self.iolog.events.append((Status.OUTPUT, out))
+        if self.batch is None:
             self.output.put(out)
-            return ip + 2
-        elif op == OpCode.JMPIFT:
-            [a, to] = self.memory[ip+1:ip+3]
-            return self.fetch(to, fb) if self.fetch(a, fa) else ip + 3
-        elif op == OpCode.JMPIFF:
-            [a, b] = self.memory[ip+1:ip+3]
-            return self.fetch(b, fb) if not self.fetch(a, fa) else ip + 3
-        elif op == OpCode.LT:
-            [a, b, c] = self.memory[ip+1:ip+4]
-            result = 1 if self.fetch(a, fa) < self.fetch(b, fb) else 0
-            self.store(c, fc, result)
-            return ip + 4
-        elif op == OpCode.EQL:
-            [a, b, c] = self.memory[ip+1:ip+4]
-            result = 1 if self.fetch(a, fa) == self.fetch(b, fb) else 0
-            self.store(c, fc, result)
-            return ip + 4
-        elif op == OpCode.RPA:
-            a = self.memory[ip+1]
-            self.rp += self.fetch(a, fa)
-            return ip + 2
-        elif op == OpCode.END:
-            return None
         else:
-            raise IntCodeError(f'illegal opcode {op}')
+            self.batch.append(out)
+            if self.stop & Status.OUTPUT:
+                raise Paused(Status.OUTPUT, ip + 2)
+        return ip + 2
+
+    def op_jmpift(self, ip, fa, fb, fc):
+        memory = self.memory
+        return self.fetch(memory[ip+2], fb) if self.fetch(memory[ip+1], fa) else ip + 3
+
+    def op_jmpiff(self, ip, fa, fb, fc):
+        memory = self.memory
+        return self.fetch(memory[ip+2], fb) if not self.fetch(memory[ip+1], fa) else ip + 3
+
+    def op_lt(self, ip, fa, fb, fc):
+        memory = self.memory
+        result = 1 if self.fetch(memory[ip+1], fa) < self.fetch(memory[ip+2], fb) else 0
+        self.store(memory[ip+3], fc, result)
+        return ip + 4
+
+    def op_eql(self, ip, fa, fb, fc):
+        memory = self.memory
+        result = 1 if self.fetch(memory[ip+1], fa) == self.fetch(memory[ip+2], fb) else 0
+        self.store(memory[ip+3], fc, result)
+        return ip + 4
+
+    def op_rpa(self, ip, fa, fb, fc):
+        self.rp += self.fetch(self.memory[ip+1], fa)
+        return ip + 2
+
+    def op_end(self, ip, fa, fb, fc):
+        return None
 
     def parse_operation(self, op: int):
-        (op1, op2, fa, fb, fc) = digits(op)
-        return (OpCode(10*op2 + op1), OpFlags(fa), OpFlags(fb), OpFlags(fc))
+        return parse_operation(op)
 
     def run(self):
         #print('intcode run')
+        self.reset()
+        try:
+            self.resume()
+        except Paused:
+            # cancelled or out of its limits
+            self.finished = True
+        #print('intcode done')
+
+    def reset(self):
         self.finished = False
-        self.memory = self.program.copy() + [0] * 2**16
+        self.reset_memory()
+        self.decoded = {}
+        self.blocks = {}
+        self.block_sizes = {}
+        self.code_cells = {}
+        self.fusions = Counter()
+        self.reset_limits()
+        for watch in self.watches:
+            self.read_watch(watch)
+        # blocks are not used on array memory, an overflow in the middle of
+        # a block could not be undone to run it again on the promoted memory
+        if isinstance(self.memory, array):
+            pass
+        elif self.engine == 'compiled':
+            self.load_blocks()
+        elif self.engine == 'fused':
+            self.load_fusions()
         self.ip = 0
         self.rp = 0
-        while self.ip is not None:
-            self.ip = self.operation(self.ip)
 
+    def resume(self, limit=None):
+        '''continue running from the current instruction pointer
+
+        The engine runs in steps of QUANTUM instructions. When a limit is given
+        execution stops with Paused(Status.LIMIT) after about that many, and
+        likewise when max_instructions or max_time since reset() run out.
+        The engines count the instructions they run in executed, an input
+        instruction waiting for its value counts once it gets it. After
+        cancel() it stops with Paused(Status.CANCELLED).
+        '''
+        self.finished = False
+        if self.profiler:
+            execute = self.execute_profiled
+        elif self.trace is not None:
+            execute = self.execute_traced
+        elif self.taint is not None:
+            execute = self.execute_tainted
+        else:
+            execute = self.engines[self.engine]
+        while self.ip is not None:
+            self.check_limits(self.ip)
+            steps = QUANTUM
+            if limit is not None:
+                steps = min(steps, limit)
+            if self.max_instructions is not None:
+                steps = min(steps, self.max_instructions - self.executed)
+            if steps <= 0:
+                raise Paused(Status.LIMIT, self.ip)
+            executed = self.executed
+            try:
+                execute(steps)
+            except OverflowError:
+                if not isinstance(self.memory, array):
+                    raise
+                # the instruction runs again on the promoted memory
+                self.executed -= 1
+                self.promote()
+            except Paused as paused:
+                if paused.status != Status.OUTPUT:
+                    # stopped before the instruction, it runs again when resumed
+                    self.executed -= 1
+                raise
+            if limit is not None:
+                limit -= self.executed - executed
+        if self.watches:
+            self.deliver_watches()
         self.finished = True
-        #print('intcode done')
+
+    def watch(self, start, stop, callback):
+        '''call callback with the changes to memory cells start to stop
+
+        The changes are delivered at the next input, output or halt as a list
+        of (address, value) of the cells holding another value than at the
+        previous delivery. Callbacks run on the thread running the machine.
+        '''
+        watch = Watch(start, stop, callback, [])
+        if self.memory:
+            # otherwise read by the first reset()
+            self.read_watch(watch)
+        self.watches.append(watch)
+        return watch
+
+    def read_watch(self, watch):
+        memory = self.memory
+        watch.values[:] = [memory[address] for address in range(watch.start, watch.stop)]
+
+    def deliver_watches(self):
+        memory = self.memory
+        for watch in self.watches:
+            changes = [(address, memory[address])
+                       for (address, value) in zip(range(watch.start, watch.stop), watch.values)
+                       if memory[address] != value]
+            if changes:
+                self.read_watch(watch)
+                watch.callback(changes)
+
+    def promote(self):
+        '''continue on python ints when a value no longer fits the array'''
+        self.memory = self.memory.tolist()
+        self.decoded = {}
+
+    def reset_limits(self):
+        '''start counting instructions and time for max_instructions and max_time'''
+        self.executed = 0
+        self.deadline = None if self.max_time is None else time.monotonic() + self.max_time
+        self.cancelled = self.token is not None and self.token.cancelled
+        self.unread = None
+
+    def exhausted(self):
+        '''whether max_instructions or max_time since reset() ran out'''
+        return ((self.max_instructions is not None and self.executed >= self.max_instructions)
+                or (self.deadline is not None and time.monotonic() > self.deadline))
+
+    def check_limits(self, ip):
+        if self.cancelled:
+            raise Paused(Status.CANCELLED, ip)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise Paused(Status.LIMIT, ip)
+
+    def cancel(self):
+        '''stop the machine from any thread, waking it when blocked on input'''
+        self.cancelled = True
+        if isinstance(self.input, queue.Queue):
+            self.input.put(CANCEL)
+        elif isinstance(self.input, Channel):
+            self.input.interrupt()
+
+    def run_until(self, stop=Status.INPUT | Status.HALT, inputs=(), limit=None):
+        '''run without threads until the machine needs input, or halts
+
+        With Status.OUTPUT in stop it also returns after every output. Values
+        in inputs are queued before continuing. With a limit it returns
+        Status.LIMIT after executing about that many instructions. Returns the
+        status and the list of values output since the previous call, which do
+        not go to the output queue. Call reset() before the first call.
+        '''
+        for value in inputs:
+            self.input.put(value)
+        self.batch = []
+        self.stop = stop
+        try:
+            self.resume(limit)
+            status = Status.HALT
+        except Paused as paused:
+            self.ip = paused.ip
+            status = paused.status
+        finally:
+            (batch, self.batch) = (self.batch, None)
+        return (status, batch)
+
+    def snapshot(self) -> Snapshot:
+        '''capture the machine state, including the values queued on its I/O
+
+        Only take a snapshot of a machine which is not running, or which is
+        blocked waiting for input. Paged memory is copied on write, so the
+        snapshot shares all pages which are not modified afterwards.
+        '''
+        return Snapshot(self.ip, self.rp, copy_memory(self.memory),
+                        dict(self.blocks), self.block_sizes, dict(self.code_cells),
+                        pending(self.input), pending(self.output))
+
+    def restore(self, snapshot: Snapshot):
+        self.ip = snapshot.ip
+        self.rp = snapshot.rp
+        self.memory = copy_memory(snapshot.memory)
+        self.finished = False
+        # a restored machine runs with fresh limits, like after reset()
+        self.reset_limits()
+        self.decoded = {}
+        self.blocks = dict(snapshot.blocks)
+        self.block_sizes = snapshot.block_sizes
+        self.code_cells = dict(snapshot.code_cells)
+        self.input = queue.Queue()
+        for value in snapshot.input:
+            self.input.put(value)
+        self.output = queue.Queue()
+        for value in snapshot.output:
+            self.output.put(value)
+
+    def fork(self) -> 'IntCode':
+        '''a new machine continuing from the current state of this one'''
+        child = IntCode(self.program, timeout=self.timeout, engine=self.engine,
+                        memory_model=self.memory_model)
+        child.restore(self.snapshot())
+        return child
+
+    def reset_memory(self):
+        if self.memory_model == 'array' and self.program != self.image_program:
+            self.image_program = list(self.program)
+            self.image = int64_image(self.program, 2**16)
+        if self.image is not None:
+            self.memory = self.image[:]
+        elif self.memory_model in ('list', 'array'):
+            self.memory = self.program.copy() + [0] * 2**16
+        elif isinstance(self.memory, PagedMemory):
+            self.memory.reset(self.program)
+        else:
+            self.memory = PagedMemory(self.program)
+
+    def execute_decoded(self, steps):
+        count = 0
+        try:
+            for count in range(1, steps + 1):
+                self.ip = self.operation(self.ip)
+                if self.ip is None:
+                    break
+        finally:
+            self.executed += count
+
+    def execute_profiled(self, steps):
+        profiler = self.profiler
+        start = time.perf_counter()
+        waited = 0.0
+        count = 0
+        try:
+            for count in range(1, steps + 1):
+                ip = self.ip
+                (op, fa, fb, fc, handler) = self.decoded.get(ip) or self.decode(ip)
+                profiler.opcodes[op] += 1
+                profiler.ips[ip] += 1
+                profiler.stacks[profiler.stack] += 1
+                if op == OpCode.IN:
+                    before = time.perf_counter()
+                    try:
+                        self.ip = handler(ip, fa, fb, fc)
+                    finally:
+                        waited += time.perf_counter() - before
+                elif op == OpCode.RPA:
+                    rp = self.rp
+                    self.ip = handler(ip, fa, fb, fc)
+                    if self.rp > rp:
+                        profiler.enter(ip)
+                    elif self.rp < rp:
+                        profiler.leave()
+                else:
+                    self.ip = handler(ip, fa, fb, fc)
+                if self.ip is None:
+                    break
+        finally:
+            self.executed += count
+            profiler.input_time += waited
+            profiler.compute_time += time.perf_counter() - start - waited
+
+    def execute_traced(self, steps):
+        trace = self.trace
+        memory = self.memory
+        count = 0
+        try:
+            for count in range(1, steps + 1):
+                ip = self.ip
+                (op, fa, fb, fc, handler) = self.decoded.get(ip) or self.decode(ip)
+                flags = (fa, fb, fc)
+                operands = tuple(self.fetch(memory[ip+n+1], flags[n]) for n in range(OPERANDS[op]))
+                if op in STORES or op == OpCode.IN:
+                    to = self.target(memory[ip + LENGTHS[op] - 1], flags[LENGTHS[op] - 2])
+                self.ip = handler(ip, fa, fb, fc)
+                if op in STORES or op == OpCode.IN:
+                    result = memory[to]
+                elif op == OpCode.OUT:
+                    result = operands[0]
+                elif op == OpCode.RPA:
+                    result = self.rp
+                else:
+                    result = self.ip
+                trace.append(TraceEntry(ip, op, operands, result))
+                if self.ip is None:
+                    break
+        finally:
+            self.executed += count
+
+    def execute_tainted(self, steps):
+        taint = self.taint
+        memory = self.memory
+        count = 0
+        try:
+            for count in range(1, steps + 1):
+                ip = self.ip
+                (op, fa, fb, fc, handler) = self.decoded.get(ip) or self.decode(ip)
+                flags = (fa, fb, fc)
+                labels = taint.control
+                if OpFlags.RELATIVE in flags[:LENGTHS[op] - 1]:
+                    labels |= taint.base
+                # the opcode and parameters, when an input was stored into the code
+                for cell in range(ip, ip + LENGTHS[op]):
+                    labels |= taint.cells.get(cell, frozenset())
+                for n in range(OPERANDS[op]):
+                    if flags[n] != OpFlags.IMMEDIATE:
+                        labels |= taint.cells.get(self.target(memory[ip+n+1], flags[n]), frozenset())
+                if labels - taint.used:
+                    if taint.on_first_use is not None:
+                        taint.on_first_use(labels - taint.used, self)
+                    taint.used |= labels
+                if labels:
+                    taint.instructions[ip] = taint.instructions.get(ip, frozenset()) | labels
+                if op in STORES or op == OpCode.IN:
+                    to = self.target(memory[ip + LENGTHS[op] - 1], flags[LENGTHS[op] - 2])
+                self.ip = handler(ip, fa, fb, fc)
+                if op == OpCode.IN:
+                    labels |= {taint.inputs}
+                    taint.stored[taint.inputs] = to
+                    taint.inputs += 1
+                if op in STORES or op == OpCode.IN:
+                    if labels:
+                        taint.cells[to] = labels
+                    else:
+                        taint.cells.pop(to, None)
+                elif op == OpCode.RPA:
+                    taint.base = labels
+                elif op in (OpCode.JMPIFT, OpCode.JMPIFF):
+                    taint.control = labels
+                if self.ip is None:
+                    break
+        finally:
+            self.executed += count
+
+    def execute_table(self, steps):
+        memory = self.memory
+        ip = self.ip
+        count = 0
+        try:
+            for count in range(1, steps + 1):
+                ip = DISPATCH[memory[ip]](self, memory, ip)
+                if ip is None:
+                    break
+        finally:
+            self.ip = ip
+            self.executed += count
+
+    def load_blocks(self):
+        import intcode_compiler
+        compiled = intcode_compiler.load(self.program)
+        self.blocks = dict(compiled.BLOCKS)
+        self.block_sizes = compiled.SIZES
+        self.code_cells = dict(compiled.CELLS)
+
+    def load_fusions(self):
+        import intcode_peephole
+        fused = intcode_peephole.load(self.program)
+        self.blocks = dict(fused['FUSED'])
+        self.block_sizes = fused['SIZES']
+        self.code_cells = dict(fused['CELLS'])
+
+    def execute_compiled(self, steps):
+        memory = self.memory
+        blocks = self.blocks
+        sizes = self.block_sizes
+        code_cells = self.code_cells
+        ip = self.ip
+        left = steps
+        try:
+            while left > 0:
+                block = blocks.get(ip)
+                size = 1 if block is None else sizes[ip]
+                if size > left or block is None:
+                    # not compiled, invalidated or too long for the steps left:
+                    # interpret a single instruction
+                    left -= 1
+                    ip = GUARDED_DISPATCH[memory[ip]](self, memory, ip)
+                else:
+                    left -= size
+                    ip = block(self, memory, code_cells)
+                if ip is None:
+                    break
+        finally:
+            self.ip = ip
+            self.executed += steps - left
 
     @classmethod
     def create_from_source(cls, filename, **kwargs) -> 'IntCode':
-        with open(filename, 'r') as f:
-            code = [int(s.strip()) for s in f.read().split(',')]
-            return IntCode(code, **kwargs)
+        return IntCode(load_program(filename), **kwargs)
+
+
+class Scheduler:
+    '''runs IntCode machines round robin on the calling thread
+
+    Every machine runs for at most quantum instructions per turn. Its output
+    is cut into packets of packet_size values, and route(source, packet)
+    returns the (destination, values) deliveries to make for each packet.
+
+    A machine waiting on empty input is skipped, or with an idle_input it gets
+    that value instead, like a network card reading -1. A machine is idle when
+    it waits without input, or read the idle_input and waits again without
+    output since. When all machines are idle or halted and no packets are
+    pending, on_idle is called; it returns True when it delivered something
+    and running should continue. A machine cancelled or out of its limits
+    stops like a halted one. Machines must be reset before running them.
+    '''
+
+    def __init__(self, vms, route, packet_size=1, quantum=QUANTUM, idle_input=None, on_idle=None):
+        self.vms = list(vms)
+        self.route = route
+        self.packet_size = packet_size
+        self.quantum = quantum
+        self.idle_input = idle_input
+        self.on_idle = on_idle
+        self.buffers = [[] for _ in self.vms]
+        self.waiting = [False] * len(self.vms)
+        self.idle = [False] * len(self.vms)
+        self.halted = [False] * len(self.vms)
+        self.stopped = False
+
+    def send(self, destination, values):
+        for value in values:
+            self.vms[destination].input.put(value)
+        self.idle[destination] = False
+
+    def stop(self):
+        self.stopped = True
+
+    def turn(self, index):
+        vm = self.vms[index]
+        if self.waiting[index] and vm.input.empty():
+            if self.idle_input is None:
+                self.idle[index] = True
+                return
+            vm.input.put(self.idle_input)
+            self.idle[index] = True
+        (status, outputs) = vm.run_until(limit=self.quantum)
+        self.waiting[index] = status == Status.INPUT
+        # besides the end of its quantum, LIMIT means the machine is out of its limits
+        self.halted[index] = (status not in (Status.INPUT, Status.LIMIT)
+                              or (status == Status.LIMIT and vm.exhausted()))
+        if outputs:
+            self.idle[index] = False
+            buffer = self.buffers[index]
+            buffer += outputs
+            while len(buffer) >= self.packet_size:
+                packet = buffer[:self.packet_size]
+                del buffer[:self.packet_size]
+                for (destination, values) in self.route(index, packet):
+                    self.send(destination, values)
+
+    def is_idle(self):
+        # a machine which ran out of its quantum after the idle_input is busy
+        return all(halted or (waiting and idle and vm.input.empty() and not buffer)
+                   for (vm, halted, waiting, idle, buffer)
+                   in zip(self.vms, self.halted, self.waiting, self.idle, self.buffers))
+
+    def run(self):
+        while not self.stopped and not all(self.halted):
+            for index in range(len(self.vms)):
+                if not self.halted[index]:
+                    self.turn(index)
+            if self.is_idle() and not (self.on_idle and self.on_idle()):
+                break
+
+
+class AsyncIntCode:
+    '''drives an IntCode machine from asyncio, with asyncio queues as I/O
+
+    The machine runs on the event loop thread and only yields to other tasks
+    when it waits for input.
+    '''
+
+    def __init__(self, vm: IntCode, input=None, output=None):
+        self.vm = vm
+        self.input = input or asyncio.Queue()
+        self.output = output or asyncio.Queue()
+
+    async def run(self, reset=True):
+        '''run the machine, from its start unless reset is False
+
+        Returns the status it stopped with, HALT unless it was cancelled or
+        ran out of its limits.
+        '''
+        if reset:
+            self.vm.reset()
+        (status, batch) = self.vm.run_until()
+        while True:
+            for value in batch:
+                await self.output.put(value)
+            if status != Status.INPUT:
+                return status
+            value = await self.input.get()
+            (status, batch) = self.vm.run_until(inputs=[value])
+
+
+class Query:
+    '''a program computing a pure function of its inputs, with memoized answers
+
+    The machine runs once up to its first input and is restored to that
+    point for every query. Calling the query with the input values returns
+    the outputs as a tuple, the maxsize latest answers are cached.
+    '''
+
+    def __init__(self, program, maxsize=4096, **options):
+        self.vm = IntCode(program, **options)
+        self.vm.reset()
+        (_, self.prefix) = self.vm.run_until()
+        self.start = self.vm.snapshot()
+        self.cached = lru_cache(maxsize)(self.evaluate)
+
+    def __call__(self, *inputs):
+        return self.cached(*inputs)
+
+    def evaluate(self, *inputs):
+        self.vm.restore(self.start)
+        (_, outputs) = self.vm.run_until(inputs=inputs)
+        return tuple(self.prefix + outputs)
+
+    def cache_info(self):
+        return self.cached.cache_info()
+
+
+class AsciiTerminal:
+    '''line based text I/O with a machine running on the calling thread
+
+    Output is decoded a batch at a time. Values above 255 are not text, they
+    are collected in results.
+    '''
+
+    def __init__(self, vm: IntCode):
+        self.vm = vm
+        self.reset()
+
+    def reset(self):
+        self.vm.reset()
+        self.vm.input = Channel()
+        self.text = ''
+        self.results = []
+        self.status = None
+
+    def send_line(self, line):
+        self.vm.input.extend(f'{line}\n'.encode('ascii'))
+
+    def run(self):
+        '''run until the machine needs more input or halts, decoding its output'''
+        (self.status, values) = self.vm.run_until()
+        try:
+            self.text += bytes(values).decode('latin-1')
+        except ValueError:
+            for value in values:
+                if 0 <= value < 256:
+                    self.text += chr(value)
+                else:
+                    self.results.append(value)
+        return self.status
+
+    def read_until(self, prompt):
+        '''the output up to and including prompt, running the machine as needed'''
+        while prompt not in self.text:
+            if self.status is not None and not (self.status == Status.INPUT and not self.vm.input.empty()):
+                raise IntCodeError(f'no {prompt!r} in output, machine stopped with {self.status!r}')
+            self.run()
+        (head, _, self.text) = self.text.partition(prompt)
+        return head + prompt
+
+    def read_lines(self):
+        '''the complete lines of output, after running until the machine needs input'''
+        if self.status != Status.HALT:
+            self.run()
+        (*lines, self.text) = self.text.split('\n')
+        return lines
+
+
+class IntCodePool:
+    '''reusable machines of one program, handed out paused at their first input
+
+    One machine runs the start of the program once, up to its first input
+    instruction, and every machine handed out is restored from a snapshot of
+    that point. Outputs made before it wait in the output queue. A program
+    which never asks for input is handed out at its start.
+    '''
+
+    def __init__(self, program, **options):
+        self.program = list(program)
+        self.options = options
+        vm = IntCode(self.program, **options)
+        vm.reset()
+        (status, outputs) = vm.run_until()
+        if status != Status.INPUT:
+            vm.reset()
+            outputs = []
+        for value in outputs:
+            vm.output.put(value)
+        self.start = vm.snapshot()
+        self.free = [vm]
+
+    def acquire(self) -> IntCode:
+        vm = self.free.pop() if self.free else IntCode(self.program, **self.options)
+        vm.restore(self.start)
+        return vm
+
+    def release(self, vm: IntCode):
+        self.free.append(vm)
+
+    @contextmanager
+    def machine(self):
+        vm = self.acquire()
+        try:
+            yield vm
+        finally:
+            self.release(vm)
+
+
+class Checkpoint(NamedTuple):
+    '''state of a Rerunner run just before it first used an input'''
+    snapshot: Snapshot
+    outputs: list
+    consumed: int
+
+
+class Rerunner:
+    '''reruns a program on inputs differing from a first run, from the latest
+    state that does not depend on the values that changed
+
+    The first run is analysed with a Taint, and checkpoints the machine before
+    the first use of every input. A rerun restores the checkpoint of the first
+    input which changed, stores the new value in the cell the input was read
+    into, and continues. When only inputs the first run never used changed its
+    result is returned, but they can be used on the other path a changed input
+    leads to: any other changed input read before the checkpoint means a full
+    rerun.
+    '''
+
+    def __init__(self, program, **options):
+        self.program = list(program)
+        self.options = options
+        self.vm = IntCode(self.program, **options)
+        self.inputs = None
+        self.result = None
+        self.checkpoints = {}
+
+    def checkpoint(self, labels, vm):
+        state = Checkpoint(vm.snapshot(), list(vm.batch), vm.taint.inputs)
+        for k in labels:
+            self.checkpoints[k] = state
+
+    def analyse(self, inputs):
+        self.taint = Taint(self.checkpoint)
+        self.checkpoints = {}
+        vm = IntCode(self.program, taint=self.taint, **self.options)
+        vm.reset()
+        self.result = vm.run_until(inputs=inputs)
+        self.inputs = list(inputs)
+        return self.result
+
+    def rerun(self, inputs):
+        # inputs left unread by the previous run must not be read by this one
+        self.vm.reset()
+        self.vm.input = queue.Queue()
+        return self.vm.run_until(inputs=inputs)
+
+    def run(self, inputs):
+        '''(status, outputs) of running the program on inputs'''
+        inputs = list(inputs)
+        if self.inputs is None:
+            return self.analyse(inputs)
+        if len(inputs) != len(self.inputs):
+            return self.rerun(inputs)
+        changed = [k for (k, (a, b)) in enumerate(zip(inputs, self.inputs)) if a != b]
+        used = [k for k in changed if k in self.taint.used]
+        if not used:
+            return (self.result[0], list(self.result[1]))
+        k = used[0]
+        (snapshot, outputs, consumed) = self.checkpoints[k]
+        if any(j != k and j < consumed for j in changed):
+            return self.rerun(inputs)
+        self.vm.restore(snapshot)
+        self.vm.input = queue.Queue()
+        address = self.taint.stored[k]
+        self.vm.memory[address] = inputs[k]
+        if address in self.vm.code_cells:
+            self.vm.invalidate(address)
+        (status, more) = self.vm.run_until(inputs=inputs[consumed:])
+        return (status, outputs + more)
+
+
+# programs loaded by this process, shared by all machines
+_programs = {}
+
+
+def save_binary(program, filename):
+    '''write a program as int64 cells, values outside int64 are escaped'''
+    cells = []
+    escaped = []
+    for value in program:
+        if BIGINT < value < 2**63:
+            cells.append(value)
+        else:
+            cells.append(BIGINT)
+            escaped.append(str(value))
+    # written aside and renamed, so other processes never load part of it
+    partial = f'{filename}.{os.getpid()}'
+    with open(partial, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, len(cells), len(escaped)))
+        f.write(struct.pack(f'<{len(cells)}q', *cells))
+        f.write(','.join(escaped).encode())
+    os.replace(partial, filename)
+
+
+def load_binary(filename):
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            (magic, count, _) = BINARY_HEADER.unpack_from(mapped)
+            if magic != BINARY_MAGIC:
+                raise IntCodeError(f'{filename} is not a binary IntCode program')
+            start = BINARY_HEADER.size
+            end = start + 8 * count
+            if sys.byteorder == 'little':
+                with memoryview(mapped) as view, view[start:end].cast('q') as cells:
+                    program = list(cells)
+            else:
+                program = list(struct.unpack_from(f'<{count}q', mapped, start))
+            escaped = iter(mapped[end:].decode().split(','))
+    return tuple(int(next(escaped)) if value == BIGINT else value for value in program)
+
+
+def load_program(filename):
+    '''the program in a source file, parsed once per file and process
+
+    The parsed program is cached in binary form next to the source and loaded
+    from there as long as the source is not modified.
+    '''
+    program = _programs.get(filename)
+    if program is None:
+        if filename.endswith(BINARY_SUFFIX):
+            program = load_binary(filename)
+        else:
+            binary = os.path.splitext(filename)[0] + BINARY_SUFFIX
+            if os.path.exists(binary) and os.path.getmtime(binary) >= os.path.getmtime(filename):
+                program = load_binary(binary)
+            else:
+                with open(filename, 'r') as f:
+                    program = tuple(int(s.strip()) for s in f.read().split(','))
+                try:
+                    save_binary(program, binary)
+                except OSError:
+                    pass
+        _programs[filename] = program
+    return program
+
+
+def replay(program, iolog: IOLog, **options):
+    '''rerun a logged session on a fresh machine, without threads or timeouts
+
+    Feeds the logged inputs and checks the outputs against the log. Returns
+    the status and outputs of run_until.
+    '''
+    vm = IntCode(program, **options)
+    vm.reset()
+    (status, outputs) = vm.run_until(inputs=iolog.inputs)
+    expected = iolog.outputs
+    for (n, (actual, logged)) in enumerate(zip(outputs, expected)):
+        if actual != logged:
+            raise IntCodeError(f'replay diverged at output {n}: {actual} != {logged}')
+    if len(outputs) < len(expected):
+        raise IntCodeError(f'replay produced {len(outputs)} of {len(expected)} outputs')
+    return (status, outputs)
+
+
+# program of the worker processes of map_inputs
+_worker_program = None
+_worker_options = None
+
+
+def _init_worker(program, options):
+    global _worker_program, _worker_options
+    _worker_program = program
+    _worker_options = options
+
+
+def _run_worker(inputs):
+    vm = IntCode(_worker_program, **_worker_options)
+    vm.reset()
+    return vm.run_until(inputs=inputs)
+
+
+def map_inputs(program, input_sequences, workers=None, chunksize=16, **options):
+    '''run a fresh machine for every input sequence on a pool of processes
+
+    The program is sent once to every worker process. Yields the (Status,
+    outputs) of run_until for every sequence, in order. Other keyword
+    arguments are passed on to IntCode.
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(list(program), options)) as executor:
+        yield from executor.map(_run_worker, input_sequences, chunksize=chunksize)
 
 
 def digits(n):
     for _ in range(5):
         yield n % 10
         n //= 10
+
+
+def parse_operation(op: int):
+    (op1, op2, fa, fb, fc) = digits(op)
+    return (OpCode(10*op2 + op1), OpFlags(fa), OpFlags(fb), OpFlags(fc))
+
+
+# source templates for the table engine handlers, one per opcode
+PARAMETERS = {
+    OpFlags.POSITIONAL: 'memory[memory[ip+{n}]]',
+    OpFlags.IMMEDIATE: 'memory[ip+{n}]',
+    OpFlags.RELATIVE: 'memory[vm.rp+memory[ip+{n}]]',
+}
+
+TARGETS = {
+    OpFlags.POSITIONAL: 'memory[ip+{n}]',
+    OpFlags.RELATIVE: 'vm.rp+memory[ip+{n}]',
+}
+
+STORES = {
+    OpCode.ADD: '{a} + {b}',
+    OpCode.MULT: '{a} * {b}',
+    OpCode.LT: '1 if {a} < {b} else 0',
+    OpCode.EQL: '1 if {a} == {b} else 0',
+}
+
+OPERATIONS = {
+    OpCode.IN: 'return vm.op_in(ip, fa, fb, fc)',
+    OpCode.OUT: 'return vm.op_out(ip, fa, fb, fc)',
+    OpCode.JMPIFT: 'return {b} if {a} else ip + 3',
+    OpCode.JMPIFF: 'return ip + 3 if {a} else {b}',
+    OpCode.RPA: 'vm.rp += {a}\n    return ip + 2',
+    OpCode.END: 'return None',
+}
+
+STORE = 'memory[{c}] = {value}\n    return ip + 4'
+
+# stores of the compiled engine fallback must invalidate overwritten blocks
+GUARDED_STORE = '''address = {c}
+    memory[address] = {value}
+    if address in vm.code_cells:
+        vm.invalidate(address)
+    return ip + 4'''
+
+
+def compile_handler(raw: int, guarded=False):
+    '''generate the table engine handler for a raw opcode including its flags'''
+    try:
+        (op, fa, fb, fc) = parse_operation(raw)
+    except ValueError:
+        raise IntCodeError(f'illegal opcode {raw}')
+    a = PARAMETERS[fa].format(n=1)
+    b = PARAMETERS[fb].format(n=2)
+    if op in STORES:
+        if fc not in TARGETS:
+            raise IntCodeError(f'Invalid opcode flags : {fc}')
+        template = GUARDED_STORE if guarded else STORE
+        body = template.format(
+            c=TARGETS[fc].format(n=3),
+            value=STORES[op].format(a=a, b=b))
+    else:
+        body = OPERATIONS[op].format(a=a, b=b)
+    namespace = {'fa': fa, 'fb': fb, 'fc': fc}
+    exec(f'def handler(vm, memory, ip):\n    {body}\n', namespace)
+    return namespace['handler']
+
+
+class DispatchTable(dict):
+    '''handlers of the table engine indexed by raw opcode, generated on first use'''
+
+    def __init__(self, guarded=False):
+        super().__init__()
+        self.guarded = guarded
+
+    def __missing__(self, raw):
+        handler = compile_handler(raw, self.guarded)
+        self[raw] = handler
+        return handler
+
+
+DISPATCH = DispatchTable()
+GUARDED_DISPATCH = DispatchTable(guarded=True)
@@ -0,0 +1,190 @@
+import numpy as np
+
+from intcode import IntCode, OpCode, OpFlags, Status, IntCodeError, parse_operation
+
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+
+# memory beyond the program of every lane, lanes going further fall back
+HEADROOM = 1024
+
+
+def fits_int64(values):
+    return all(INT64_MIN <= v <= INT64_MAX for v in values)
+
+
+class BatchIntCode:
+    '''runs one program on many inputs in lock step, every lane is a machine
+
+    The memory of all lanes is a 2-D int64 array. Every step executes one
+    instruction for all active lanes at the lowest instruction pointer which
+    hold the same opcode there, the other lanes wait. A lane which overflows
+    int64 or addresses memory outside the array continues as a scalar IntCode
+    machine on python ints.
+    '''
+
+    def __init__(self, program, memory_size=None):
+        self.program = list(program)
+        self.memory_size = memory_size or len(self.program) + HEADROOM
+
+    def run(self, inputs, patches=None):
+        '''run a lane per input sequence, returns (Status, outputs) per lane
+
+        patches maps addresses to the value for every lane, like the noun and
+        verb of day 2. A lane needing more input than given stops with
+        Status.INPUT.
+        '''
+        lanes = len(inputs)
+        self.results = [None] * lanes
+        self.outputs = [[] for _ in range(lanes)]
+        self.inputs = [list(sequence) for sequence in inputs]
+        self.in_pos = np.zeros(lanes, dtype=np.int64)
+        self.ip = np.zeros(lanes, dtype=np.int64)
+        self.rp = np.zeros(lanes, dtype=np.int64)
+        self.active = np.ones(lanes, dtype=bool)
+        self.memory = np.zeros((lanes, self.memory_size), dtype=np.int64)
+
+        if not fits_int64(self.program):
+            for lane in range(lanes):
+                self.fallback(lane, self.program, patches)
+            return self.results
+
+        self.memory[:, :len(self.program)] = self.program
+        width = max((len(sequence) for sequence in self.inputs), default=0)
+        self.input_array = np.zeros((lanes, max(width, 1)), dtype=np.int64)
+        self.input_length = np.array([len(sequence) for sequence in self.inputs], dtype=np.int64)
+        for lane in range(lanes):
+            values = self.inputs[lane] + [patches[a][lane] for a in patches or {}]
+            if not fits_int64(values):
+                self.fallback(lane, self.program, patches)
+            else:
+                self.input_array[lane, :len(self.inputs[lane])] = self.inputs[lane]
+        for (address, values) in (patches or {}).items():
+            column = [v if self.active[lane] else 0 for (lane, v) in enumerate(values)]
+            self.memory[:, address] = column
+
+        while self.active.any():
+            self.step()
+        return self.results
+
+    def fallback(self, lane, memory, patches=None):
+        '''continue a lane on a scalar machine from its current state'''
+        vm = IntCode(self.program, memory_model='list')
+        vm.reset()
+        vm.memory[:len(memory)] = memory
+        for (address, values) in (patches or {}).items():
+            vm.memory[address] = values[lane]
+        vm.ip = int(self.ip[lane])
+        vm.rp = int(self.rp[lane])
+        inputs = self.inputs[lane][int(self.in_pos[lane]):]
+        (status, outputs) = vm.run_until(inputs=inputs)
+        self.finish(lane, status, outputs)
+
+    def finish(self, lane, status, outputs=()):
+        self.active[lane] = False
+        self.outputs[lane] += outputs
+        self.results[lane] = (status, self.outputs[lane])
+
+    def demote(self, lanes):
+        for lane in lanes:
+            self.fallback(lane, [int(v) for v in self.memory[lane]])
+
+    def step(self):
+        candidates = np.flatnonzero(self.active)
+        lane = candidates[np.argmin(self.ip[candidates])]
+        ip = int(self.ip[lane])
+        if not 0 <= ip < self.memory_size - 3:
+            self.demote([lane])
+            return
+        raw = int(self.memory[lane, ip])
+        lanes = candidates[(self.ip[candidates] == ip) & (self.memory[candidates, ip] == raw)]
+        try:
+            (op, fa, fb, fc) = parse_operation(raw)
+        except ValueError:
+            raise IntCodeError(f'illegal opcode {raw}')
+        self.execute(lanes, ip, op, (fa, fb, fc))
+
+    def address(self, lanes, ip, n, flags):
+        par = self.memory[lanes, ip + n]
+        if flags == OpFlags.POSITIONAL:
+            return par
+        elif flags == OpFlags.RELATIVE:
+            return self.rp[lanes] + par
+        else:
+            raise IntCodeError(f'Invalid opcode flags : {flags}')
+
+    def operands(self, lanes, ip, flags, count):
+        '''the operand values, and a mask of the lanes addressing valid memory'''
+        values = []
+        valid = np.ones(len(lanes), dtype=bool)
+        for n in range(count):
+            if flags[n] == OpFlags.IMMEDIATE:
+                values.append(self.memory[lanes, ip + n + 1])
+            else:
+                address = self.address(lanes, ip, n + 1, flags[n])
+                inside = (address >= 0) & (address < self.memory_size)
+                valid &= inside
+                values.append(self.memory[lanes, np.where(inside, address, 0)])
+        return values, valid
+
+    def store_address(self, lanes, ip, n, flags):
+        address = self.address(lanes, ip, n, flags)
+        return address, (address >= 0) & (address < self.memory_size)
+
+    def execute(self, lanes, ip, op, flags):
+        if op == OpCode.END:
+            for lane in lanes:
+                self.finish(lane, Status.HALT)
+            return
+
+        if op in (OpCode.ADD, OpCode.MULT, OpCode.LT, OpCode.EQL):
+            ((a, b), valid) = self.operands(lanes, ip, flags, 2)
+            (to, inside) = self.store_address(lanes, ip, 3, flags[2])
+            valid &= inside
+            with np.errstate(over='ignore'):
+                if op == OpCode.ADD:
+                    result = a + b
+                    valid &= ((a ^ result) & (b ^ result)) >= 0
+                elif op == OpCode.MULT:
+                    result = a * b
+                    safe_a = np.where(a == 0, 1, a)
+                    valid &= (a == 0) | ((result // safe_a == b) & ~((a == -1) & (b == INT64_MIN)))
+                elif op == OpCode.LT:
+                    result = (a < b).astype(np.int64)
+                else:
+                    result = (a == b).astype(np.int64)
+            self.demote(lanes[~valid])
+            self.memory[lanes[valid], to[valid]] = result[valid]
+            self.ip[lanes[valid]] = ip + 4
+
+        elif op == OpCode.IN:
+            (to, valid) = self.store_address(lanes, ip, 1, flags[0])
+            self.demote(lanes[~valid])
+            lanes = lanes[valid]
+            to = to[valid]
+            starved = self.in_pos[lanes] >= self.input_length[lanes]
+            for lane in lanes[starved]:
+                self.finish(lane, Status.INPUT)
+            (lanes, to) = (lanes[~starved], to[~starved])
+            self.memory[lanes, to] = self.input_array[lanes, self.in_pos[lanes]]
+            self.in_pos[lanes] += 1
+            self.ip[lanes] = ip + 2
+
+        elif op == OpCode.OUT:
+            ((a,), valid) = self.operands(lanes, ip, flags, 1)
+            self.demote(lanes[~valid])
+            for (lane, value) in zip(lanes[valid], a[valid]):
+                self.outputs[lane].append(int(value))
+            self.ip[lanes[valid]] = ip + 2
+
+        elif op in (OpCode.JMPIFT, OpCode.JMPIFF):
+            ((a, b), valid) = self.operands(lanes, ip, flags, 2)
+            self.demote(lanes[~valid])
+            jump = (a != 0) if op == OpCode.JMPIFT else (a == 0)
+            self.ip[lanes[valid]] = np.where(jump, b, ip + 3)[valid]
+
+        elif op == OpCode.RPA:
+            ((a,), valid) = self.operands(lanes, ip, flags, 1)
+            self.demote(lanes[~valid])
+            self.rp[lanes[valid]] += a[valid]
+            self.ip[lanes[valid]] = ip + 2
@@ -0,0 +1,232 @@
+import hashlib
+import importlib.util
+import os
+
+from intcode import LENGTHS, OpCode, OpFlags, STORES, parse_operation
+
+VERSION = 3
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.intcode_cache')
+
+JUMPS = {OpCode.JMPIFT, OpCode.JMPIFF}
+
+# left to the interpreter so blocks never stop halfway for I/O
+INTERPRETED = {OpCode.IN, OpCode.OUT}
+
+_modules = {}
+
+
+def unconditional(op, flags, params):
+    '''whether the jump has an immediate condition which always jumps'''
+    return flags[0] == OpFlags.IMMEDIATE and bool(params[0]) == (op == OpCode.JMPIFT)
+
+
+def decode(program, ip):
+    '''decode the instruction at ip as (op, flags, params), None if not valid'''
+    if not 0 <= ip < len(program):
+        return None
+    try:
+        (op, fa, fb, fc) = parse_operation(program[ip])
+    except ValueError:
+        return None
+    length = LENGTHS[op]
+    if ip + length > len(program):
+        return None
+    if op in STORES and fc == OpFlags.IMMEDIATE:
+        return None
+    if op == OpCode.IN and fa == OpFlags.IMMEDIATE:
+        return None
+    return (op, (fa, fb, fc), program[ip+1:ip+length])
+
+
+def find_blocks(program):
+    '''statically decode the reachable instructions and the basic block leaders
+
+    Jumps through memory cannot be followed, so the address following an
+    unconditional jump becomes a leader when the program uses it as an
+    immediate constant: that is how callers push their return address.
+    '''
+    instructions = {}
+    leaders = {0}
+    returns = set()
+    constants = set()
+    todo = [0]
+    while todo:
+        ip = todo.pop()
+        while ip not in instructions:
+            instruction = decode(program, ip)
+            if instruction is None:
+                break
+            instructions[ip] = instruction
+            (op, flags, params) = instruction
+            constants.update(p for (p, f) in zip(params, flags) if f == OpFlags.IMMEDIATE)
+            next_ip = ip + 1 + len(params)
+            if op == OpCode.END:
+                break
+            if op in INTERPRETED:
+                leaders.add(next_ip)
+            elif op in JUMPS:
+                if flags[1] == OpFlags.IMMEDIATE:
+                    leaders.add(params[1])
+                    todo.append(params[1])
+                if unconditional(op, flags, params):
+                    returns.add(next_ip)
+                    break
+                leaders.add(next_ip)
+            ip = next_ip
+        if not todo:
+            todo = list((returns & constants) - leaders)
+            leaders.update(todo)
+    return instructions, leaders
+
+
+def parameter(value, flags):
+    if flags == OpFlags.IMMEDIATE:
+        return str(value)
+    elif flags == OpFlags.POSITIONAL:
+        return f'memory[{value}]'
+    else:
+        return f'memory[rp + {value}]'
+
+
+def target(value, flags):
+    if flags == OpFlags.POSITIONAL:
+        return str(value)
+    else:
+        return f'rp + {value}'
+
+
+def exit_block(ip):
+    return ['vm.rp = rp', f'return {ip}']
+
+
+def translate_block(leader, instructions, leaders, code):
+    '''python statements for the block starting at leader, the cells it covers
+    and the number of instructions in it
+
+    The engine counts the whole block as executed, a block leaving early
+    because it overwrote its own code takes back the instructions it skipped.
+    '''
+    body = ['rp = vm.rp']
+    cells = set()
+    size = 0
+    # the body lines of the early exits, with the instructions executed before them
+    early = []
+    ip = leader
+    while True:
+        (op, (fa, fb, fc), params) = instructions[ip]
+        if op in INTERPRETED:
+            body += exit_block(ip)
+            break
+        next_ip = ip + 1 + len(params)
+        cells.update(range(ip, next_ip))
+        size += 1
+        if op in STORES:
+            (a, b, c) = params
+            value = STORES[op].format(a=parameter(a, fa), b=parameter(b, fb))
+            if fc == OpFlags.POSITIONAL and c not in code:
+                body.append(f'memory[{c}] = {value}')
+            else:
+                body.append(f'address = {target(c, fc)}')
+                body.append(f'memory[address] = {value}')
+                body.append('if address in code:')
+                body.append('    vm.rp = rp')
+                body.append('    vm.invalidate(address)')
+                early.append((len(body), size))
+                body.append(None)
+                body.append(f'    return {next_ip}')
+        elif op == OpCode.RPA:
+            body.append(f'rp += {parameter(params[0], fa)}')
+        elif op in JUMPS:
+            (a, b) = (parameter(params[0], fa), parameter(params[1], fb))
+            body.append('vm.rp = rp')
+            if op == OpCode.JMPIFT:
+                body.append(f'return {b} if {a} else {next_ip}')
+            else:
+                body.append(f'return {next_ip} if {a} else {b}')
+            break
+        elif op == OpCode.END:
+            body += exit_block(None)
+            break
+        if next_ip in leaders or next_ip not in instructions:
+            body += exit_block(next_ip)
+            break
+        ip = next_ip
+    for (line, executed) in early:
+        if executed < size:
+            body[line] = f'    vm.executed -= {size - executed}'
+    return [statement for statement in body if statement is not None], cells, size
+
+
+def block_leaders(instructions, leaders):
+    return sorted(ip for ip in leaders
+                  if ip in instructions and instructions[ip][0] not in INTERPRETED)
+
+
+def translate(program):
+    '''python source of a module with the compiled blocks of the program
+
+    The module defines BLOCKS mapping leader addresses to block functions,
+    SIZES with the number of instructions in every block and CELLS mapping
+    every memory cell compiled into a block to its leaders.
+    '''
+    (instructions, leaders) = find_blocks(program)
+    # a first pass to learn which cells hold compiled code
+    code = set()
+    for leader in block_leaders(instructions, leaders):
+        code |= translate_block(leader, instructions, leaders, set())[1]
+
+    lines = [f'# generated by intcode_compiler {VERSION}, do not edit', '']
+    cells = {}
+    sizes = {}
+    for leader in block_leaders(instructions, leaders):
+        (body, block_cells, sizes[leader]) = translate_block(leader, instructions, leaders, code)
+        lines.append(f'def block_{leader}(vm, memory, code):')
+        lines.extend(f'    {statement}' for statement in body)
+        lines.append('')
+        for cell in block_cells:
+            cells.setdefault(cell, []).append(leader)
+
+    lines.append('BLOCKS = {')
+    lines.extend(f'    {leader}: block_{leader},'
+                 for leader in block_leaders(instructions, leaders))
+    lines.append('}')
+    lines.append('')
+    lines.append('SIZES = {')
+    lines.extend(f'    {leader}: {size},' for (leader, size) in sizes.items())
+    lines.append('}')
+    lines.append('')
+    lines.append('CELLS = {')
+    lines.extend(f'    {cell}: {tuple(cells[cell])},' for cell in sorted(cells))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def program_hash(program):
+    source = f'{VERSION}:' + ','.join(str(v) for v in program)
+    return hashlib.sha256(source.encode()).hexdigest()[:24]
+
+
+def load(program):
+    '''the compiled module of the program, translated only when not cached on disk'''
+    key = program_hash(program)
+    module = _modules.get(key)
+    if module is None:
+        name = f'intcode_{key}'
+        path = os.path.join(CACHE_DIR, f'{name}.py')
+        if not os.path.exists(path):
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            partial = f'{path}.{os.getpid()}'
+            with open(partial, 'w') as f:
+                f.write(translate(program))
+            os.replace(partial, path)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[key] = module
+    return module
+
+
+if __name__ == '__main__':
+    import sys
+    with open(sys.argv[1], 'r') as f:
+        print(translate([int(s.strip()) for s in f.read().split(',')]))
@@ -0,0 +1,141 @@
+from collections import Counter
+from typing import NamedTuple
+
+from intcode import OPERANDS, OpCode, OpFlags, STORES
+from intcode_compiler import JUMPS, find_blocks, unconditional
+
+
+class Block(NamedTuple):
+    '''a basic block, instructions are (ip, op, flags, params)'''
+    leader: int
+    instructions: list
+    successors: list
+
+
+def basic_blocks(program):
+    '''the reachable code of the program as {leader: Block}
+
+    The static successors of a jump through memory are unknown, such a jump
+    gets every return address of the program as its successors.
+    '''
+    (instructions, leaders) = find_blocks(program)
+    targets = set()
+    after_jump = {}
+    for (ip, (op, flags, params)) in instructions.items():
+        if op in JUMPS:
+            after_jump[ip + 3] = unconditional(op, flags, params)
+            if flags[1] == OpFlags.IMMEDIATE:
+                targets.add(params[1])
+    # find_blocks also splits at I/O, which does not change the control flow
+    leaders = {ip for ip in leaders if ip == 0 or ip in targets or ip in after_jump}
+    returns = sorted(ip for ip in leaders if after_jump.get(ip))
+
+    blocks = {}
+    for leader in sorted(ip for ip in leaders if ip in instructions):
+        block = Block(leader, [], [])
+        ip = leader
+        while True:
+            (op, flags, params) = instructions[ip]
+            block.instructions.append((ip, op, flags, params))
+            next_ip = ip + 1 + len(params)
+            if op == OpCode.END:
+                break
+            if op in JUMPS:
+                if flags[1] == OpFlags.IMMEDIATE:
+                    block.successors.append(params[1])
+                else:
+                    block.successors.extend(returns)
+                if not unconditional(op, flags, params):
+                    block.successors.append(next_ip)
+                break
+            if next_ip in leaders or next_ip not in instructions:
+                block.successors.append(next_ip)
+                break
+            ip = next_ip
+        blocks[leader] = block
+    return blocks
+
+
+def control_flow_graph(program):
+    '''{leader: set of successor leaders}'''
+    return {leader: set(block.successors) for (leader, block) in basic_blocks(program).items()}
+
+
+def memory_usage(program):
+    '''the cells executed as code, read as data and written, as three sets
+
+    Only positional operands are known statically, relative ones depend on
+    the relative base at run time.
+    '''
+    (instructions, _) = find_blocks(program)
+    code = set()
+    reads = set()
+    writes = set()
+    for (ip, (op, flags, params)) in instructions.items():
+        code.update(range(ip, ip + 1 + len(params)))
+        operands = OPERANDS[op]
+        for (n, (param, flag)) in enumerate(zip(params, flags)):
+            if flag != OpFlags.POSITIONAL:
+                continue
+            if n < operands:
+                reads.add(param)
+            elif op in STORES or op == OpCode.IN:
+                writes.add(param)
+    return code, reads, writes
+
+
+def instruction_mix(program):
+    '''static counts of the reachable instructions by opcode and by addressing mode'''
+    (instructions, _) = find_blocks(program)
+    opcodes = Counter(op for (op, _, _) in instructions.values())
+    modes = Counter(flag for (op, flags, params) in instructions.values()
+                    for flag in flags[:len(params)])
+    return opcodes, modes
+
+
+def operand(param, flags, blocks=()):
+    if flags == OpFlags.IMMEDIATE:
+        return f'block_{param}' if param in blocks else str(param)
+    elif flags == OpFlags.POSITIONAL:
+        return f'[{param}]'
+    else:
+        return f'[rp{param:+}]'
+
+
+def listing(program):
+    '''the labeled basic blocks as assembler text'''
+    blocks = basic_blocks(program)
+    lines = []
+    for block in blocks.values():
+        successors = ', '.join(f'block_{ip}' for ip in block.successors)
+        lines.append(f'block_{block.leader}:' + (f'  ; -> {successors}' if successors else ''))
+        for (ip, op, flags, params) in block.instructions:
+            operands = [operand(param, flag, blocks if op in JUMPS and n == 1 else ())
+                        for (n, (param, flag)) in enumerate(zip(params, flags))]
+            lines.append(f'{ip:8}  {op.name:7} {", ".join(operands)}'.rstrip())
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def summary(program):
+    '''the memory usage and the static instruction mix as text'''
+    (code, reads, writes) = memory_usage(program)
+    (opcodes, modes) = instruction_mix(program)
+    total = sum(opcodes.values())
+    lines = [
+        f'{len(program)} cells, {len(code)} code, {len(reads | writes)} data',
+        f'{len(code & writes)} code cells written: {sorted(code & writes)}',
+        f'{len(basic_blocks(program))} basic blocks, {total} instructions',
+    ]
+    lines.extend(f'{count:8} {100 * count / total:5.1f}% {op.name}'
+                 for (op, count) in opcodes.most_common())
+    lines.extend(f'{count:8} {flag.name.lower()}' for (flag, count) in modes.most_common())
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import sys
+    from intcode import load_program
+    program = load_program(sys.argv[1])
+    print(listing(program))
+    print(summary(program))
@@ -0,0 +1,144 @@
+from collections import Counter
+
+from intcode import IntCode, OpCode, OpFlags, STORES
+from intcode_compiler import JUMPS, find_blocks, parameter, program_hash, target, unconditional
+
+COMPARISONS = {OpCode.LT, OpCode.EQL}
+
+_modules = {}
+
+
+def match(first, second):
+    '''the kind of superinstruction a pair of instructions fuses into, or None
+
+    compare-branch and arith-branch store a value and branch on it, call
+    pushes the return address on the relative stack and jumps, and return
+    drops the stack frame and jumps back through it.
+    '''
+    (op, flags, params) = first
+    (jump, jump_flags, jump_params) = second
+    if jump not in JUMPS:
+        return None
+    if op in STORES:
+        if (jump_flags[0], jump_params[0]) == (flags[2], params[2]):
+            return 'compare-branch' if op in COMPARISONS else 'arith-branch'
+        if flags[2] == OpFlags.RELATIVE and unconditional(*second):
+            return 'call'
+    elif op == OpCode.RPA and unconditional(*second):
+        return 'return'
+    return None
+
+
+def find_pairs(program):
+    '''the fusable pairs of reachable instructions as {ip: (kind, first, second)}'''
+    (instructions, _) = find_blocks(program)
+    pairs = {}
+    for (ip, first) in instructions.items():
+        second = instructions.get(ip + 1 + len(first[2]))
+        if second is not None:
+            kind = match(first, second)
+            if kind is not None:
+                pairs[ip] = (kind, first, second)
+    return pairs
+
+
+def translate_pair(ip, kind, first, second, code):
+    '''python statements executing both instructions of the pair at ip'''
+    (op, (fa, fb, fc), params) = first
+    (jump, (ja, jb, _), (x, y)) = second
+    middle = ip + 1 + len(params)
+    after = middle + 3
+    body = ['rp = vm.rp', f'vm.fusions[{kind!r}] += 1']
+    condition = parameter(x, ja)
+    if op == OpCode.RPA:
+        body.append(f'rp += {parameter(params[0], fa)}')
+        body.append('vm.rp = rp')
+    else:
+        (a, b, c) = params
+        body.append(f'value = {STORES[op].format(a=parameter(a, fa), b=parameter(b, fb))}')
+        if fc == OpFlags.POSITIONAL and c not in code:
+            body.append(f'memory[{c}] = value')
+        else:
+            body.append(f'address = {target(c, fc)}')
+            body.append('memory[address] = value')
+            body.append('if address in code:')
+            body.append('    vm.invalidate(address)')
+            # the jump did not run
+            body.append('    vm.executed -= 1')
+            body.append(f'    return {middle}')
+        if kind.endswith('-branch'):
+            condition = 'value'
+    destination = parameter(y, jb)
+    if unconditional(*second):
+        body.append(f'return {destination}')
+    elif jump == OpCode.JMPIFT:
+        body.append(f'return {destination} if {condition} else {after}')
+    else:
+        body.append(f'return {after} if {condition} else {destination}')
+    return body
+
+
+def translate(program):
+    '''python source defining FUSED, SIZES and CELLS like a compiled module'''
+    pairs = find_pairs(program)
+    code = set()
+    for (ip, (_, first, _)) in pairs.items():
+        code.update(range(ip, ip + len(first[2]) + 4))
+
+    lines = ['# generated by intcode_peephole, do not edit', '']
+    for (ip, (kind, first, second)) in sorted(pairs.items()):
+        lines.append(f'def fused_{ip}(vm, memory, code):')
+        lines.extend(f'    {statement}' for statement in translate_pair(ip, kind, first, second, code))
+        lines.append('')
+    lines.append('FUSED = {')
+    lines.extend(f'    {ip}: fused_{ip},' for ip in sorted(pairs))
+    lines.append('}')
+    lines.append('')
+    lines.append('SIZES = {ip: 2 for ip in FUSED}')
+    lines.append('')
+    cells = {}
+    for (ip, (_, first, _)) in sorted(pairs.items()):
+        for cell in range(ip, ip + len(first[2]) + 4):
+            cells.setdefault(cell, []).append(ip)
+    lines.append('CELLS = {')
+    lines.extend(f'    {cell}: {tuple(cells[cell])},' for cell in sorted(cells))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def load(program):
+    '''namespace with the fused superinstructions of the program'''
+    key = program_hash(program)
+    module = _modules.get(key)
+    if module is None:
+        module = {}
+        exec(compile(translate(program), f'<intcode_peephole {key}>', 'exec'), module)
+        _modules[key] = module
+    return module
+
+
+def report(program, inputs=(), limit=None):
+    '''run the program on the fused engine until it needs more input or halts
+
+    Returns the dynamic count of instructions executed inside superinstructions
+    per kind.
+    '''
+    vm = IntCode(program, engine='fused')
+    vm.reset()
+    vm.run_until(inputs=inputs, limit=limit)
+    return Counter({kind: 2 * count for (kind, count) in vm.fusions.items()})
+
+
+if __name__ == '__main__':
+    import sys
+    from intcode import Profiler, load_program
+    program = load_program(sys.argv[1])
+    inputs = [int(s) for s in sys.argv[2:]]
+    counts = report(program, inputs)
+    profiler = Profiler()
+    vm = IntCode(program, profiler=profiler)
+    vm.reset()
+    vm.run_until(inputs=inputs)
+    for (kind, count) in counts.most_common():
+        print(f'{count:10} {kind}')
+    print(f'{sum(counts.values()):10} of {sum(profiler.opcodes.values())} instructions fused')
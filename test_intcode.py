@@ -1,13 +1,32 @@
 
 import pytest
+import asyncio
 import queue
 
+import intcode
 from intcode import IntCode
 
+
+@pytest.fixture(params=['decode', 'table', 'compiled', 'fused'])
+def engine(request, monkeypatch):
+    monkeypatch.setattr(intcode, 'ENGINE', request.param)
+    return request.param
+
+
+@pytest.fixture(params=['list', 'paged', 'array'])
+def memory_model(request, monkeypatch):
+    monkeypatch.setattr(intcode, 'MEMORY_MODEL', request.param)
+    return request.param
+
+
+# tests running machines with the default engine and memory model run on all of them
+machines = pytest.mark.usefixtures('engine', 'memory_model')
+
 def parse(source):
     return [int(s.strip()) for s in source.split(',')]
         
 
+@machines
 def test_day5():
     code = parse('''3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,
 1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
@@ -24,6 +43,7 @@ def test_day5():
     assert 1001 == prg.output.get()
 
            
+@machines
 def test_day5_full():
     with open('day5_input.txt', 'r') as f:
         code = [int(t) for t in  f.read().split(',')]
@@ -36,6 +56,7 @@ def test_day5_full():
     assert result == 15586959
 
 
+@machines
 def test_day_9():
     code = parse('109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99')
     prg = IntCode(code)
@@ -45,6 +66,7 @@ def test_day_9():
         assert c == prg.output.get()
 
 
+@machines
 def test_day_9_2():
     code = parse('1102,34915192,34915192,7,4,7,99,0')
     prg = IntCode(code)
@@ -56,6 +78,7 @@ def test_day_9_2():
     assert len(str(out)) == 16
 
 
+@machines
 def test_day_9_3():
     code = parse('104,1125899906842624,99')
     prg = IntCode(code)
@@ -67,6 +90,7 @@ def test_day_9_3():
     assert out == 1125899906842624
 
 
+@machines
 def test_day_9_boost():
     with open('day9_input.txt', 'r') as f:
         code = [int(s.strip()) for s in f.read().split(',')]
@@ -78,5 +102,680 @@ def test_day_9_boost():
     assert prg.output.get() == 3780860499
     assert prg.output.empty()
 
+@machines
+def test_self_modifying_code():
+    # prints 1, then overwrites the print instruction with a halt and jumps back
+    code = parse('104,1,1101,0,99,0,1105,1,0')
+    prg = IntCode(code)
+    prg.run()
+
+    assert prg.output.get() == 1
+    assert prg.output.empty()
+
+
+@machines
+def test_overwritten_block():
+    # patches the immediate operand of the first instruction and loops once
+    code = parse('1101,5,0,30,4,30,1101,0,7,1,1008,30,7,31,1005,31,20,1105,1,0,99')
+    prg = IntCode(code)
+    prg.run()
+
+    assert prg.output.get() == 5
+    assert prg.output.get() == 7
+    assert prg.output.empty()
+
+
+@machines
+def test_overwritten_fused_pair():
+    # the compare-branch pair at 0 gets its jump target patched to 18
+    code = parse('1008,30,0,31,1005,31,8,99,104,1,1101,0,18,6,1105,1,0,99,104,2,99')
+    prg = IntCode(code)
+    prg.reset()
+
+    assert prg.run_until(limit=1000) == (intcode.Status.HALT, [1, 2])
+
+
+def test_fused_superinstructions():
+    import intcode_peephole
+    # a counted loop calling a function which outputs its argument
+    code = parse('109,50,1101,3,0,40,21001,40,0,1,21101,17,0,0,1105,1,25,1001,40,-1,40,1005,40,6,99,'
+                 '109,2,204,-1,109,-2,2106,0,0')
+    pairs = intcode_peephole.find_pairs(code)
+    prg = IntCode(code, engine='fused', memory_model='list')
+    prg.reset()
+
+    assert {kind for (kind, _, _) in pairs.values()} == {'call', 'arith-branch', 'return'}
+    assert prg.run_until() == (intcode.Status.HALT, [3, 2, 1])
+    assert prg.fusions == {'call': 3, 'arith-branch': 3, 'return': 3}
+
+
+def test_disassembler():
+    import intcode_disasm
+    code = parse('109,50,1101,3,0,40,21001,40,0,1,21101,17,0,0,1105,1,25,1001,40,-1,40,1005,40,6,99,'
+                 '109,2,204,-1,109,-2,2106,0,0')
+
+    assert intcode_disasm.control_flow_graph(code) == {
+        0: {6}, 6: {25}, 17: {6, 24}, 24: set(), 25: {17}}
+    (cells, reads, writes) = intcode_disasm.memory_usage(code)
+    assert cells == set(range(len(code)))
+    assert (reads, writes) == ({40}, {40})
+    assert intcode_disasm.instruction_mix(code)[0][intcode.OpCode.RPA] == 3
+    assert '      14  JMPIFT  1, block_25' in intcode_disasm.listing(code)
+
+
+def test_compiled_module_cached(tmp_path, monkeypatch):
+    import intcode_compiler
+    monkeypatch.setattr(intcode_compiler, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(intcode_compiler, '_modules', {})
+    code = parse('109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99')
+
+    compiled = intcode_compiler.load(code)
+
+    assert len(list(tmp_path.glob('intcode_*.py'))) == 1
+    assert 0 in compiled.BLOCKS
+
+
+def test_paged_memory_grows():
+    memory = intcode.PagedMemory([1, 2, 3])
+    memory[2**20] = 42
+
+    assert memory[2] == 3
+    assert memory[2**20] == 42
+    assert memory[2**20 + 1] == 0
+
+
+def test_paged_memory_reset():
+    program = [1, 2, 3]
+    memory = intcode.PagedMemory(program)
+    memory[0] = 7
+    memory[2**20] = 42
+
+    memory.reset(program)
+
+    assert memory[0] == 1
+    assert memory[2**20] == 0
+    assert memory.touched == set()
+
+
+@machines
+def test_fork():
+    code = parse('3,11,3,12,1,11,12,13,4,13,99,0,0,0')
+    prg = IntCode(code)
+    prg.reset()
+    prg.input.put(40)
+
+    child = prg.fork()
+    child.input.put(2)
+    child.resume()
+
+    assert child.output.get() == 42
+    assert prg.ip == 0
+    assert prg.input.get() == 40
+    assert prg.memory[13] == 0
+
+
+@machines
+def test_snapshot_restore():
+    code = parse('3,11,3,12,1,11,12,13,4,13,99,0,0,0')
+    prg = IntCode(code)
+    prg.reset()
+    prg.input.put(1)
+    prg.input.put(2)
+    snapshot = prg.snapshot()
+    prg.resume()
+    assert prg.output.get() == 3
+
+    prg.restore(snapshot)
+    prg.resume()
+
+    assert prg.output.get() == 3
+
+
+def test_fork_shares_pages():
+    memory = intcode.PagedMemory(list(range(3 * intcode.PAGE_SIZE)))
+    other = memory.copy()
+    other[0] = -1
+
+    assert memory[0] == 0
+    assert other.pages[1] is memory.pages[1]
+    assert other.pages[0] is not memory.pages[0]
+
+
+@machines
+def test_run_until():
+    code = parse('3,11,3,12,1,11,12,13,4,13,99,0,0,0')
+    prg = IntCode(code)
+    prg.reset()
+
+    assert prg.run_until() == (intcode.Status.INPUT, [])
+    assert prg.run_until(inputs=[40]) == (intcode.Status.INPUT, [])
+    assert prg.run_until(inputs=[2]) == (intcode.Status.HALT, [42])
+    assert prg.output.empty()
+
+
+@machines
+def test_run_until_output():
+    code = parse('109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99')
+    prg = IntCode(code)
+    prg.reset()
+
+    outputs = []
+    status = intcode.Status.OUTPUT
+    while status == intcode.Status.OUTPUT:
+        (status, batch) = prg.run_until(intcode.Status.OUTPUT)
+        assert len(batch) <= 1
+        outputs += batch
+
+    assert status == intcode.Status.HALT
+    assert outputs == code
+
+
+@machines
+def test_async_pipeline():
+    code = parse('3,9,1002,9,2,9,4,9,99,0')
+
+    async def pipeline(value):
+        first = intcode.AsyncIntCode(IntCode(code))
+        second = intcode.AsyncIntCode(IntCode(code), input=first.output)
+        await first.input.put(value)
+        await asyncio.gather(first.run(), second.run())
+        return await second.output.get()
+
+    assert asyncio.run(pipeline(5)) == 20
+
+
+@machines
+def test_async_limits():
+    prg = IntCode(parse('1105,1,0'), max_instructions=1000)
+    assert asyncio.run(intcode.AsyncIntCode(prg).run()) == intcode.Status.LIMIT
+
+    token = intcode.CancelToken()
+    prg = IntCode(parse('3,0,1105,1,0'), token=token)
+    token.cancel()
+    assert asyncio.run(intcode.AsyncIntCode(prg).run()) == intcode.Status.CANCELLED
+
+
+@machines
+def test_run_until_limit():
+    prg = IntCode(parse('1105,1,0'))
+    prg.reset()
+
+    assert prg.run_until(limit=100) == (intcode.Status.LIMIT, [])
+
+
+@machines
+def test_scheduler():
+    # two machines passing a counter back and forth, incrementing it
+    code = parse('3,11,1001,11,1,11,4,11,1105,1,0,0')
+    vms = [IntCode(code), IntCode(code)]
+    for vm in vms:
+        vm.reset()
+    vms[0].input.put(0)
+    received = []
+
+    def route(source, packet):
+        received.append((source, packet[0]))
+        return [(1 - source, packet)] if packet[0] < 10 else []
+
+    intcode.Scheduler(vms, route, quantum=3).run()
+
+    assert received[-1] == (1, 10)
+    assert len(received) == 10
+
+
+@machines
+def test_scheduler_on_idle():
+    # increments its input, -1 means no input
+    code = parse('3,20,1008,20,-1,21,1005,21,0,1001,20,1,20,4,20,1105,1,0,0,0,0,0')
+    vms = [IntCode(code)]
+    vms[0].reset()
+    received = []
+    kicks = [100, 200]
+
+    def on_idle():
+        if not kicks:
+            return False
+        scheduler.send(0, [kicks.pop(0)])
+        return True
+
+    scheduler = intcode.Scheduler(vms, lambda source, packet: received.extend(packet) or [],
+                                  idle_input=-1, on_idle=on_idle)
+    scheduler.run()
+
+    assert received[-2:] == [101, 201]
+
+
+@machines
+def test_scheduler_idle_small_quantum():
+    # the first machine counts to 20 after its input before it outputs 42
+    vms = [IntCode(parse('3,100,1001,101,1,101,1007,101,20,102,1005,102,2,104,42,99')),
+           IntCode(parse('3,50,1105,1,0'))]
+    for vm in vms:
+        vm.reset()
+    received = []
+
+    intcode.Scheduler(vms, lambda source, packet: received.extend(packet) or [],
+                      quantum=10, idle_input=-1).run()
+
+    assert received == [42]
+
+
+@machines
+def test_scheduler_stops_limited_machines():
+    token = intcode.CancelToken()
+    vms = [IntCode(parse('1105,1,0'), max_instructions=1000),
+           IntCode(parse('1105,1,0'), token=token),
+           IntCode(parse('104,7,99'))]
+    for vm in vms:
+        vm.reset()
+    token.cancel()
+    scheduler = intcode.Scheduler(vms, lambda source, packet: [], quantum=100)
+
+    scheduler.run()
+
+    assert scheduler.halted == [True, True, True]
+    assert vms[0].executed == 1000
+
+
+def test_batch_matches_scalar():
+    from intcode_batch import BatchIntCode
+    with open('day19_input.txt', 'r') as f:
+        code = parse(f.read())
+    points = [(x, y) for x in range(0, 50, 7) for y in range(0, 50, 7)]
+
+    results = BatchIntCode(code).run(points)
+
+    for (point, (status, outputs)) in zip(points, results):
+        prg = IntCode(code)
+        prg.reset()
+        assert (status, outputs) == prg.run_until(inputs=point)
+
+
+def test_batch_overflow_falls_back():
+    from intcode_batch import BatchIntCode
+    code = parse('3,11,1002,11,4294967296,11,4,11,99,0,0,0')
+
+    results = BatchIntCode(code).run([[1], [4294967296], []])
+
+    assert results == [
+        (intcode.Status.HALT, [4294967296]),
+        (intcode.Status.HALT, [2**64]),
+        (intcode.Status.INPUT, []),
+    ]
+
+
+def test_batch_patches():
+    from intcode_batch import BatchIntCode
+    code = parse('1,0,0,0,4,0,99')
+
+    results = BatchIntCode(code).run([[], []], patches={1: [5, 6], 2: [5, 0]})
+
+    assert [outputs for (_, outputs) in results] == [[0], [100]]
+
+
+def test_map_inputs():
+    with open('day5_input.txt', 'r') as f:
+        code = parse(f.read())
+
+    results = list(intcode.map_inputs(code, [[5], [1], [5]], workers=2, chunksize=1))
+
+    assert results[0] == (intcode.Status.HALT, [15586959])
+    assert results[1][1][-1] == 9775037
+    assert results[2] == results[0]
+
+
+@pytest.mark.usefixtures('memory_model')
+def test_profiler(tmp_path):
+    # main calls a function at 10 which adjusts the relative base around its body
+    code = parse('109,100,21101,9,0,0,1105,1,10,99,109,2,104,7,109,-2,2106,0,0')
+    profiler = intcode.Profiler()
+    prg = IntCode(code, profiler=profiler)
+    prg.run()
+
+    assert prg.output.get() == 7
+    assert profiler.opcodes[intcode.OpCode.OUT] == 1
+    assert profiler.ips[12] == 1
+    assert profiler.stacks['main;fn@0;fn@10'] == 2
+    assert 'instructions: 8' in profiler.report()
+    profiler.write_collapsed(tmp_path / 'intcode.folded')
+    assert 'main;fn@0;fn@10 2' in (tmp_path / 'intcode.folded').read_text()
+
+
+@pytest.mark.usefixtures('memory_model')
+def test_trace():
+    code = parse('3,11,3,12,1,11,12,13,4,13,99,0,0,0')
+    prg = IntCode(code, trace=3)
+    prg.input.put(40)
+    prg.input.put(2)
+    prg.run()
+
+    assert list(prg.trace) == [
+        intcode.TraceEntry(4, intcode.OpCode.ADD, (40, 2), 42),
+        intcode.TraceEntry(8, intcode.OpCode.OUT, (42,), 42),
+        intcode.TraceEntry(10, intcode.OpCode.END, (), None),
+    ]
+
+
+@machines
+def test_replay(tmp_path):
+    with open('day5_input.txt', 'r') as f:
+        code = parse(f.read())
+    iolog = intcode.IOLog()
+    prg = IntCode(code, iolog=iolog)
+    prg.input.put(1)
+    prg.run()
+    iolog.save(tmp_path / 'day5.json')
+
+    (status, outputs) = intcode.replay(code, intcode.IOLog.load(tmp_path / 'day5.json'))
+
+    assert status == intcode.Status.HALT
+    assert outputs[-1] == 9775037
+    assert iolog.inputs == [1]
+
+
+@machines
+def test_replay_diverged():
+    iolog = intcode.IOLog([(intcode.Status.INPUT, 1), (intcode.Status.OUTPUT, 2)])
+
+    with pytest.raises(intcode.IntCodeError):
+        intcode.replay(parse('3,5,4,5,99,0'), iolog)
+
+
+def test_binary_program(tmp_path):
+    program = (109, 2**70, -2**63, 2**63 - 1, -7, 99)
+    intcode.save_binary(program, tmp_path / 'program.icb')
+
+    assert intcode.load_binary(tmp_path / 'program.icb') == program
+
+
+def test_load_program_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(intcode, '_programs', {})
+    source = tmp_path / 'program.txt'
+    source.write_text('104,1125899906842624,99\n')
+
+    program = intcode.load_program(str(source))
+
+    assert program == (104, 1125899906842624, 99)
+    assert (tmp_path / 'program.icb').exists()
+    assert intcode.load_program(str(source)) is program
+    monkeypatch.setattr(intcode, '_programs', {})
+    assert intcode.load_program(str(source)) == program
+
+
+@machines
+def test_query():
+    # outputs the product of two inputs
+    query = intcode.Query(parse('3,11,3,12,2,11,12,13,4,13,99,0,0,0'), maxsize=2)
+
+    assert query(6, 7) == (42,)
+    assert query(2, 3) == (6,)
+    assert query(6, 7) == (42,)
+    assert query(4, 4) == (16,)
+    assert query(2, 3) == (6,)
+    info = query.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 4, 2)
+
+
+@machines
+def test_max_instructions():
+    prg = IntCode(parse('1105,1,0'), max_instructions=25000)
+    prg.reset()
+
+    assert prg.run_until() == (intcode.Status.LIMIT, [])
+    assert prg.executed == 25000
+
+
+@machines
+def test_max_instructions_with_io():
+    prg = IntCode(parse('104,1,1105,1,0'), max_instructions=1000)
+    prg.reset()
+
+    statuses = [prg.run_until(intcode.Status.OUTPUT)[0] for _ in range(600)]
+    assert statuses[499] == intcode.Status.OUTPUT
+    assert statuses[500] == intcode.Status.LIMIT
+    assert prg.executed == 1000
+
+    # reads input forever
+    prg = IntCode(parse('3,0,1105,1,0'), max_instructions=1000)
+    prg.reset()
+    statuses = [prg.run_until(inputs=[3])[0] for _ in range(600)]
+    assert statuses[498] == intcode.Status.INPUT
+    assert statuses[499] == intcode.Status.LIMIT
+    assert prg.executed == 1000
+
+
+@machines
+def test_executed_on_halt():
+    prg = IntCode(parse('1101,1,2,5,99,0'))
+    prg.reset()
+
+    assert prg.run_until() == (intcode.Status.HALT, [])
+    assert prg.executed == 2
+
+
+@machines
+@pytest.mark.parametrize('source', [
+    # patches the immediate operand of the first instruction and loops once
+    '1101,5,0,30,4,30,1101,0,7,1,1008,30,7,31,1005,31,20,1105,1,0,99',
+    # patches the jump target of the compare-branch pair at 0
+    '1008,30,0,31,1005,31,8,99,104,1,1101,0,18,6,1105,1,0,99,104,2,99',
+])
+def test_executed_matches_decode(source):
+    code = parse(source)
+    reference = IntCode(code, engine='decode')
+    reference.reset()
+    assert reference.run_until()[0] == intcode.Status.HALT
+
+    for budget in range(1, reference.executed + 1):
+        prg = IntCode(code, max_instructions=budget)
+        expected = IntCode(code, engine='decode', max_instructions=budget)
+        prg.reset()
+        expected.reset()
+        assert prg.run_until() == expected.run_until()
+        assert prg.executed == expected.executed
+
+
+@machines
+def test_max_time():
+    prg = IntCode(parse('1105,1,0'), max_time=0.05)
+    prg.reset()
+
+    assert prg.run_until() == (intcode.Status.LIMIT, [])
+
+
+@machines
+def test_cancel_blocked_input():
+    import threading
+    import time
+    token = intcode.CancelToken()
+    machines = [IntCode(parse('3,0,99'), timeout=10, token=token) for _ in range(3)]
+    threads = [threading.Thread(target=prg.run) for prg in machines]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.01)
+
+    start = time.perf_counter()
+    token.cancel()
+    for thread in threads:
+        thread.join()
+
+    assert time.perf_counter() - start < 1
+    assert all(prg.finished and prg.cancelled for prg in machines)
+    machines[0].reset()
+    assert machines[0].run_until() == (intcode.Status.CANCELLED, [])
+
+
+@pytest.mark.usefixtures('engine')
+def test_array_memory_promotion():
+    # 2**62 * 4 and an input of 2**70 do not fit int64
+    prg = IntCode(parse('1102,4611686018427387904,4,11,4,11,3,12,4,12,99,0,0'), memory_model='array')
+    prg.reset()
+
+    assert type(prg.memory).__name__ == 'array'
+    assert prg.run_until(inputs=[2**70]) == (intcode.Status.HALT, [2**64, 2**70])
+    assert type(prg.memory) is list
+    prg.reset()
+    assert type(prg.memory).__name__ == 'array'
+
+
+@machines
+@machines
+def test_program_edited_after_construction():
+    prg = IntCode(parse('104,1,99'))
+    prg.program[1] = 2
+    prg.reset()
+
+    assert prg.run_until() == (intcode.Status.HALT, [2])
+
+
+def test_channel():
+    # outputs 0 to 999
+    prg = IntCode(parse('4,14,1001,14,1,14,1007,14,1000,15,1005,15,0,99,0,0'))
+    prg.output = intcode.Channel()
+    prg.run()
+
+    values = prg.output.drain()
+    assert values.tolist() == list(range(1000))
+    assert prg.output.empty()
+    assert len(prg.output.drain()) == 0
+
+
+def test_channel_queue_interface():
+    channel = intcode.Channel([1, 2])
+    channel.put(2**70)
+    channel.put(4)
+
+    assert channel.get() == 1
+    assert channel.pending() == (2, 2**70, 4)
+    assert list(channel.drain()) == [2, 2**70, 4]
+    with pytest.raises(queue.Empty):
+        channel.get(True, 0.01)
+
+
+@machines
+def test_channel_input_cancel():
+    import threading
+    prg = IntCode(parse('3,9,4,9,1105,1,0,99,0,0'), timeout=10)
+    prg.input = intcode.Channel([5])
+    prg.output = intcode.Channel()
+    thread = threading.Thread(target=prg.run)
+    thread.start()
+
+    assert prg.output.drain(True, 5).tolist() == [5]
+    prg.cancel()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+@machines
+def test_ascii_terminal():
+    # prints ok, then 1000 plus the first input value
+    terminal = intcode.AsciiTerminal(IntCode(parse('104,111,104,107,104,10,3,17,1001,17,1000,17,4,17,99,0,0,0')))
+
+    assert terminal.read_until('ok') == 'ok'
+    with pytest.raises(intcode.IntCodeError):
+        terminal.read_until('?')
+    terminal.send_line('A')
+    assert terminal.read_lines() == ['']
+    assert terminal.results == [1065]
+    assert terminal.status == intcode.Status.HALT
+
+
+@machines
+def test_pool():
+    # outputs 7, then the double of every input
+    pool = intcode.IntCodePool(parse('104,7,3,11,1002,11,2,11,4,11,99,0'))
+
+    with pool.machine() as prg:
+        assert prg.ip == 2
+        assert prg.output.get() == 7
+        assert prg.run_until(inputs=[5]) == (intcode.Status.HALT, [10])
+    prg = pool.acquire()
+    assert (prg.ip, prg.memory[11]) == (2, 0)
+    assert prg.run_until(inputs=[6]) == (intcode.Status.HALT, [12])
+    assert pool.acquire() is not prg
+
+
+@machines
+def test_pool_limits():
+    # doubles its input after a loop, 25 instructions in all
+    pool = intcode.IntCodePool(parse('3,20,1101,0,10,21,1001,21,-1,21,1005,21,6,1002,20,2,20,4,20,99,0,0'),
+                               max_instructions=100)
+
+    for value in range(5):
+        with pool.machine() as prg:
+            assert prg.run_until(inputs=[value]) == (intcode.Status.HALT, [2 * value])
+
+
+@machines
+def test_watch():
+    # counts down cell 20 from 3, outputs 0 when done, then writes cell 21
+    prg = IntCode(parse('1001,20,-1,20,1005,20,0,104,0,1101,0,5,21,99,0,0,0,0,0,0,3,0'))
+    changes = []
+    prg.reset()
+    prg.watch(20, 22, changes.append)
+
+    assert prg.run_until() == (intcode.Status.HALT, [0])
+    assert changes == [[(20, 0)], [(21, 5)]]
+
+
+@pytest.mark.usefixtures('memory_model')
+def test_taint():
+    # phase + 10 * signal, from day 7
+    code = parse('3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0')
+    taint = intcode.Taint()
+    prg = IntCode(code, taint=taint)
+    prg.reset()
+
+    assert prg.run_until(inputs=[4, 3]) == (intcode.Status.HALT, [34])
+    assert taint.stored == {0: 15, 1: 16}
+    assert taint.cells == {15: {0, 1}, 16: {1}}
+    assert taint.instructions == {4: {1}, 8: {0, 1}, 12: {0, 1}}
+
+
+@machines
+def test_rerunner():
+    rerunner = intcode.Rerunner(parse('3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0'))
+
+    assert rerunner.run([4, 3]) == (intcode.Status.HALT, [34])
+    assert rerunner.checkpoints[1].snapshot.ip == 4
+    assert rerunner.run([4, 5]) == (intcode.Status.HALT, [54])
+    assert rerunner.run([7, 3]) == (intcode.Status.HALT, [37])
+    assert rerunner.run([1, 2]) == (intcode.Status.HALT, [21])
+
+
+@machines
+def test_rerunner_unused_input():
+    # the input is overwritten before it is read
+    rerunner = intcode.Rerunner(parse('3,9,1101,0,1,9,4,9,99,0'))
+
+    assert rerunner.run([5]) == (intcode.Status.HALT, [1])
+    assert rerunner.run([6]) == (intcode.Status.HALT, [1])
+    assert rerunner.checkpoints == {}
+
+
+@machines
+def test_rerunner_input_used_on_other_branch():
+    # outputs the first input when the second is 0, else 7
+    rerunner = intcode.Rerunner(parse('3,20,3,21,1005,21,10,4,20,99,104,7,99') + [0] * 10)
+
+    assert rerunner.run([1, 1]) == (intcode.Status.HALT, [7])
+    assert rerunner.run([2, 0]) == (intcode.Status.HALT, [2])
+
+
+@machines
+def test_rerunner_input_stored_into_code():
+    # the input is the immediate operand of the output instruction
+    rerunner = intcode.Rerunner(parse('3,3,104,11,99'))
+
+    assert rerunner.run([35]) == (intcode.Status.HALT, [35])
+    assert rerunner.run([38]) == (intcode.Status.HALT, [38])
+
+
+def test_unknown_engine():
+    with pytest.raises(intcode.IntCodeError):
+        IntCode([99], engine='turbo')
+
+
 if __name__ == "__main__":
     pytest.main([__file__])